@@ -0,0 +1,27 @@
+import time
+
+# 每次运行的开始时间，用于统计冷启动时的首次渲染耗时
+_run_started = time.perf_counter()
+
+import streamlit as st
+from utils import auth, kling_api, metrics, sd_api, startup
+
+# 文生图和换装作为同一进程里的两个页面运行：登录状态、HTTP 连接池、各类缓存、
+# 后台任务执行器和监控指标都只有一份，整个应用作为一个单元部署和扩容
+PAGES = [
+    st.Page("flyai.py", title="FlyAI 文生图", icon="🐦", default=True),
+    st.Page("virtual_tryon.py", title="AI 一键换装", icon="🎩"),
+]
+
+metrics.serve()
+# 进程内第一次运行（通常是登录页）时在后台预热两个页面的缓存
+startup.warm_up("flyai", sd_api.warm_catalogs, sd_api.warm_gallery, sd_api.warm_history)
+startup.warm_up("virtual_tryon", kling_api.warm_token, kling_api.warm_gallery)
+
+if auth.logged_in():
+    # 页面自己调用 st.set_page_config，这里在它之前不能输出任何元素
+    st.navigation(PAGES).run()
+else:
+    st.set_page_config(page_title="FlyAI", page_icon=":bird:", layout="wide")
+    auth.login_page()
+    startup.rendered("app", "login", time.perf_counter() - _run_started)
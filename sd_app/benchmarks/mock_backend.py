@@ -0,0 +1,289 @@
+"""Local stand-in for the SD backend and the Kling try-on API.
+
+Implements the endpoints used by ``flyai.py`` and ``virtual_tryon.py`` with
+configurable latency, job duration, image size and failure rates, so the
+apps can be exercised without the real servers::
+
+    cd sd_app
+    python -m benchmarks.mock_backend --port 8765 --job-duration 5
+    SD_API_URL=http://127.0.0.1:8765 KELING_API_URL=http://127.0.0.1:8765 \\
+        streamlit run app.py
+"""
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+# sdjob 接口的状态码，与 utils.sd_api.SD_JOB_STATES 对应
+SD_PENDING, SD_RUNNING, SD_SUCCEEDED, SD_FAILED = 0, 1, 2, 3
+TRYON_PATH = "/v1/images/kolors-virtual-try-on"
+
+
+class MockBackend:
+    """In-memory job store shared by the SD and Kling endpoints.
+
+    A job is queued for the first 10% of ``job_duration``, then running;
+    its images become available one by one until the job succeeds. A
+    fraction ``job_failure_rate`` of jobs fails halfway through instead, and
+    a fraction ``failure_rate`` of all requests is answered with a 503.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        latency_jitter: float = 0.02,
+        job_duration: float = 5.0,
+        image_size: tuple = (512, 512),
+        failure_rate: float = 0.0,
+        job_failure_rate: float = 0.0,
+        history: int = 30,
+        seed: int = None,
+    ):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.job_duration = job_duration
+        self.image_size = image_size
+        self.failure_rate = failure_rate
+        self.job_failure_rate = job_failure_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._jobs = {}
+        self._png = None
+        self._lock = threading.Lock()
+        for _ in range(history):
+            self.create("sd", {"prompt": "history", "imgCount": 1}, age=job_duration)
+            self.create("kling", {}, age=job_duration)
+
+    def delay(self) -> None:
+        jitter = self._rng.uniform(-self.latency_jitter, self.latency_jitter)
+        time.sleep(max(0.0, self.latency + jitter))
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            return self._rng.random() < self.failure_rate
+
+    def png(self) -> bytes:
+        # 随机噪声几乎不可压缩，体积接近真实照片的上限
+        if self._png is None:
+            width, height = self.image_size
+            image = Image.frombytes("RGB", (width, height), self._rng.randbytes(width * height * 3))
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            self._png = buffer.getvalue()
+        return self._png
+
+    def create(self, kind: str, params: dict, age: float = 0.0) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "kind": kind,
+                "params": params,
+                "count": max(1, int(params.get("imgCount", 1))),
+                "created": time.time() - age,
+                "fails": self._rng.random() < self.job_failure_rate,
+            }
+        return job_id
+
+    def view(self, job_id: str):
+        """Return ``(status, progress, ready_images, job)`` for a job, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        progress = min(1.0, (time.time() - job["created"]) / max(self.job_duration, 1e-6))
+        if job["fails"] and progress >= 0.5:
+            return SD_FAILED, progress, 0, job
+        if progress < 0.1:
+            return SD_PENDING, progress, 0, job
+        ready = min(job["count"], int(progress * job["count"] + 1e-9))
+        if progress >= 1.0:
+            return SD_SUCCEEDED, 1.0, job["count"], job
+        return SD_RUNNING, progress, ready, job
+
+    def recent(self, kind: str, page: int, page_size: int) -> list:
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job["kind"] == kind]
+        jobs.sort(key=lambda job: job["created"], reverse=True)
+        start = (max(page, 1) - 1) * page_size
+        return [job["id"] for job in jobs[start:start + page_size]]
+
+
+def _make_handler(backend: MockBackend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, data: dict, status: int = 200) -> None:
+            self._send(status, json.dumps(data).encode(), "application/json")
+
+        def _image_urls(self, job_id: str, ready: int) -> list:
+            base = f"http://{self.headers.get('Host')}"
+            return [f"{base}/images/{job_id}/{i}.png" for i in range(ready)]
+
+        def _sd_view(self, job_id: str) -> dict:
+            status, progress, ready, job = backend.view(job_id)
+            return {
+                "jobUuid": job_id,
+                "status": status,
+                "progress": round(progress, 3),
+                "step": int(progress * 20),
+                "totalSteps": 20,
+                "eta": round((1 - progress) * backend.job_duration, 1),
+                "message": "mock failure" if status == SD_FAILED else "",
+                # 回显提交的全部参数和创建时间（毫秒），搜索索引从这里读取提示词、模型、采样器和种子
+                "input": {"txt2img": job["params"]},
+                "createTime": int(job["created"] * 1000),
+                "output": {
+                    "images": [{"imageUrl": url} for url in self._image_urls(job_id, ready)]
+                },
+            }
+
+        def _kling_view(self, job_id: str) -> dict:
+            status, _, ready, _ = backend.view(job_id)
+            task_status = {
+                SD_PENDING: "submitted",
+                SD_RUNNING: "processing",
+                SD_SUCCEEDED: "succeed",
+                SD_FAILED: "failed",
+            }[status]
+            return {
+                "task_id": job_id,
+                "task_status": task_status,
+                "task_status_msg": "mock failure" if status == SD_FAILED else "",
+                "task_result": {
+                    "images": [
+                        {"index": i, "url": url}
+                        for i, url in enumerate(self._image_urls(job_id, ready))
+                    ]
+                },
+            }
+
+        def _read_json(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _route(self, method: str) -> None:
+            parts = urlsplit(self.path)
+            # 应用拼接 URL 时可能出现双斜杠
+            path = re.sub("/+", "/", parts.path).rstrip("/")
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            body = self._read_json() if method == "POST" else {}
+            backend.delay()
+            if backend.should_fail():
+                self._json({"code": 503, "message": "mock unavailable"}, status=503)
+                return
+
+            if method == "GET" and path.startswith("/images/"):
+                self._send(200, backend.png(), "image/png")
+            elif method == "GET" and path == "/api/v1/model/version/list":
+                self._json({"code": 0, "data": {"item": [
+                    {"name": f"mock-checkpoint-{i}", "model_version_uuid": f"mock-{i}"}
+                    for i in range(3)
+                ]}})
+            elif method == "GET" and path == "/api/v1/sampler/list":
+                self._json({"code": 0, "data": {"item": ["Euler a", "DPM++ 2M Karras"]}})
+            elif method == "POST" and path == "/api/v1/sdjob/text2img":
+                self._json({"code": 0, "data": {"jobUuid": backend.create("sd", body)}})
+            elif method == "GET" and path == "/api/v1/sdjob/result":
+                if backend.view(query.get("jobUuid", "")) is None:
+                    self._json({"code": 404, "message": "job not found"}, status=404)
+                else:
+                    self._json({"code": 0, "data": self._sd_view(query["jobUuid"])})
+            elif method == "GET" and path == "/api/v1/sdjob/list":
+                ids = backend.recent("sd", int(query.get("page", 1)), int(query.get("pageSize", 10)))
+                self._json({"code": 0, "data": {"item": [self._sd_view(i) for i in ids]}})
+            elif method == "POST" and path == TRYON_PATH:
+                task_id = backend.create("kling", {})
+                self._json({"code": 0, "data": {"task_id": task_id, "task_status": "submitted"}})
+            elif method == "GET" and path == TRYON_PATH:
+                ids = backend.recent(
+                    "kling", int(query.get("pageNum", 1)), int(query.get("pageSize", 10))
+                )
+                self._json({"code": 0, "data": [self._kling_view(i) for i in ids]})
+            elif method == "GET" and path.startswith(TRYON_PATH + "/"):
+                task_id = path.rsplit("/", 1)[-1]
+                if backend.view(task_id) is None:
+                    self._json({"code": 404, "message": "task not found"}, status=404)
+                else:
+                    self._json({"code": 0, "data": self._kling_view(task_id)})
+            else:
+                self._json({"code": 404, "message": "not found"}, status=404)
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_POST(self):
+            self._route("POST")
+
+    return Handler
+
+
+def serve(backend: MockBackend, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve ``backend`` from a daemon thread; ``port=0`` picks a free port."""
+    server = ThreadingHTTPServer((host, port), _make_handler(backend))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-backend", daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("mock backend")
+    group.add_argument("--latency", type=float, default=0.05, help="每个请求的平均延迟（秒）")
+    group.add_argument("--latency-jitter", type=float, default=0.02, help="延迟的随机抖动（秒）")
+    group.add_argument("--job-duration", type=float, default=5.0, help="每个任务的生成时长（秒）")
+    group.add_argument("--image-size", default="512x512", help="生成图片的尺寸，例如 1024x1024")
+    group.add_argument("--failure-rate", type=float, default=0.0, help="返回 503 的请求比例")
+    group.add_argument("--job-failure-rate", type=float, default=0.0, help="以失败结束的任务比例")
+    group.add_argument("--history", type=int, default=30, help="预先生成的历史任务数")
+    group.add_argument("--seed", type=int, default=None, help="随机数种子，便于复现")
+
+
+def from_arguments(args: argparse.Namespace) -> MockBackend:
+    width, _, height = args.image_size.partition("x")
+    return MockBackend(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        job_duration=args.job_duration,
+        image_size=(int(width), int(height or width)),
+        failure_rate=args.failure_rate,
+        job_failure_rate=args.job_failure_rate,
+        history=args.history,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = serve(from_arguments(args), args.host, args.port)
+    print(f"Mock backend listening on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Benchmark flyai.py and virtual_tryon.py headlessly against the mock backend.
+
+Each simulated user is an AppTest session on its own thread: it logs in,
+submits jobs and reruns the page every ``--poll-interval`` seconds until
+the result is shown, the way the progress fragment does in a browser.
+AppTest keeps a process-wide runtime, so script runs of different users
+are serialised; background jobs, caches and the backend are shared and
+run concurrently as they do in the real server::
+
+    cd sd_app
+    python -m benchmarks.run --users 8 --iterations 2 --job-duration 3
+    python -m benchmarks.run --app tryon --users 4 --failure-rate 0.05 --json out.json
+
+Caches start empty in a temporary directory unless ``--cache-dir`` is
+given, so consecutive runs are comparable.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks import mock_backend  # noqa: E402
+
+# AppTest 共用一个运行时，对 AppTest 的所有操作（不只是 run）都要串行
+_script_lock = threading.RLock()
+
+
+class UserStats:
+    def __init__(self):
+        self.page_seconds = []
+        self.first_image_seconds = []
+        self.job_seconds = []
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.errors = []
+
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile, or None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered) + 0.5) - 1))]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def timed_run(at, stats: UserStats) -> None:
+    with _script_lock:
+        start = time.perf_counter()
+        at.run()
+        stats.page_seconds.append(time.perf_counter() - start)
+    for exception in at.exception:
+        stats.errors.append(exception.value)
+
+
+def login(at, user: int, stats: UserStats) -> None:
+    # 登录后 st.rerun() 会在 AppTest 的元素树里留下登录表单的旧控件，
+    # 下一次运行时读取它们的状态会出错，所以直接以已登录状态开始
+    with _script_lock:
+        at.session_state["logged_in"] = True
+        at.session_state["username"] = f"bench-{user}"
+        timed_run(at, stats)
+
+
+def wait_for_result(at, key: str, job, submitted_at: float, args, stats: UserStats) -> None:
+    """Rerun the page until it has rendered the finished job."""
+    first_image = None
+    deadline = submitted_at + args.timeout
+    while time.perf_counter() < deadline:
+        time.sleep(args.poll_interval)
+        with _script_lock:
+            timed_run(at, stats)
+            at.query_params.pop(key, None)
+            rendered = job.done and key not in at.session_state
+        if first_image is None and any(error is None for _, _, _, error in job.results):
+            first_image = time.perf_counter() - submitted_at
+            stats.first_image_seconds.append(first_image)
+        if rendered:
+            break
+    stats.job_seconds.append(time.perf_counter() - submitted_at)
+    if job.done and job.results and all(error is None for _, _, _, error in job.results):
+        stats.completed += 1
+    else:
+        stats.failed += 1
+
+
+def flyai_user(user: int, args, stats: UserStats) -> None:
+    from streamlit.testing.v1 import AppTest
+    from utils import executor
+
+    with _script_lock:
+        at = AppTest.from_file(os.path.join(APP_DIR, "flyai.py"), default_timeout=args.timeout)
+    login(at, user, stats)
+    for iteration in range(args.iterations):
+        with _script_lock:
+            # 每次使用不同的种子，避免命中结果缓存
+            seed = next(
+                w for w in at.sidebar.number_input if w.label.startswith("随机种子")
+            )
+            seed.set_value(args.run_seed + user * 1000 + iteration + 1)
+            next(b for b in at.sidebar.button if b.label == "Submit").click()
+            submitted_at = time.perf_counter()
+            timed_run(at, stats)
+            job_id = at.session_state["sd_job"] if "sd_job" in at.session_state else None
+        job = executor.get(job_id) if job_id else None
+        if job is None:
+            stats.rejected += 1
+            continue
+        wait_for_result(at, "sd_job", job, submitted_at, args, stats)
+
+
+def _photo(rng: random.Random, size: tuple) -> bytes:
+    from PIL import Image
+
+    image = Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def tryon_user(user: int, args, stats: UserStats) -> None:
+    from streamlit.testing.v1 import AppTest
+    from utils import executor, kling_api, session_store
+
+    rng = random.Random(args.run_seed + user)
+    with _script_lock:
+        at = AppTest.from_file(
+            os.path.join(APP_DIR, "virtual_tryon.py"), default_timeout=args.timeout
+        )
+    login(at, user, stats)
+    for _ in range(args.iterations):
+        # AppTest 不支持 file_uploader，直接排入试穿任务，再由页面通过 URL 参数接管
+        human, cloth = _photo(rng, args.upload_size), _photo(rng, args.upload_size)
+        submitted_at = time.perf_counter()
+        job = executor.submit(
+            "kling", kling_api.run_tryon, "kolors-virtual-try-on-v1", human, cloth
+        )
+        # 与 main_page 一样，输入图片以句柄形式交给进度页展示
+        job.info["inputs"] = [
+            session_store.store.put_blob(f"bench-{user}", data) for data in (human, cloth)
+        ]
+        with _script_lock:
+            at.query_params["tryon_job"] = job.id
+        wait_for_result(at, "tryon_job", job, submitted_at, args, stats)
+
+
+def summarize(name: str, users: list, wall: float) -> dict:
+    merged = UserStats()
+    for stats in users:
+        for field in ("page_seconds", "first_image_seconds", "job_seconds", "errors"):
+            getattr(merged, field).extend(getattr(stats, field))
+        merged.completed += stats.completed
+        merged.failed += stats.failed
+        merged.rejected += stats.rejected
+    return {
+        "app": name,
+        "users": len(users),
+        "wall_seconds": wall,
+        "page_p50": percentile(merged.page_seconds, 0.5),
+        "page_p95": percentile(merged.page_seconds, 0.95),
+        "page_runs": len(merged.page_seconds),
+        "first_image_p50": percentile(merged.first_image_seconds, 0.5),
+        "first_image_p95": percentile(merged.first_image_seconds, 0.95),
+        "job_p50": percentile(merged.job_seconds, 0.5),
+        "job_p95": percentile(merged.job_seconds, 0.95),
+        "completed": merged.completed,
+        "failed": merged.failed,
+        "rejected": merged.rejected,
+        "throughput_jobs_per_s": merged.completed / wall if wall else 0.0,
+        "script_errors": merged.errors[:10],
+    }
+
+
+def run_app(name: str, user_fn, args) -> dict:
+    users = [UserStats() for _ in range(args.users)]
+
+    def run_user(i):
+        try:
+            user_fn(i, args, users[i])
+        except Exception as e:
+            users[i].errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_user, args=(i,)) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(name, users, time.perf_counter() - start)
+
+
+def _fmt(value, unit: str = "s") -> str:
+    return "-" if value is None else f"{value:.3f}{unit}"
+
+
+def report(results: list, memory: dict, timings: dict) -> None:
+    for result in results:
+        print(f"== {result['app']} ({result['users']} users, {result['wall_seconds']:.1f}s)")
+        print(f"  page latency      p50 {_fmt(result['page_p50'])}  p95 {_fmt(result['page_p95'])}"
+              f"  ({result['page_runs']} reruns)")
+        print(f"  time to 1st image p50 {_fmt(result['first_image_p50'])}"
+              f"  p95 {_fmt(result['first_image_p95'])}")
+        print(f"  job end-to-end    p50 {_fmt(result['job_p50'])}  p95 {_fmt(result['job_p95'])}")
+        print(f"  jobs              {result['completed']} ok, {result['failed']} failed,"
+              f" {result['rejected']} rejected, {result['throughput_jobs_per_s']:.2f} jobs/s")
+        for error in result["script_errors"]:
+            print(f"  error: {error}")
+    print(f"== memory  rss start {memory['rss_start_mb']:.0f} MB, end {memory['rss_end_mb']:.0f} MB,"
+          f" peak {memory['rss_peak_mb']:.0f} MB")
+    for app, values in timings.items():
+        print(f"== startup {app}  " + "  ".join(
+            f"{name} {seconds:.3f}s" for name, seconds in sorted(values.items())
+        ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", choices=["flyai", "tryon", "both"], default="both")
+    parser.add_argument("--users", type=int, default=4, help="并发模拟用户数")
+    parser.add_argument("--iterations", type=int, default=2, help="每个用户提交的任务数")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="页面重跑间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=120, help="单个任务的最长等待时间（秒）")
+    parser.add_argument("--upload-size", default="1536x2048", help="试穿上传图片的尺寸")
+    parser.add_argument("--backend-url", help="使用已运行的模拟服务而不是启动新的")
+    parser.add_argument("--cache-dir", help="复用已有的图片/结果缓存目录")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    mock_backend.add_arguments(parser)
+    args = parser.parse_args()
+    width, _, height = args.upload_size.partition("x")
+    args.upload_size = (int(width), int(height or width))
+    args.run_seed = args.seed if args.seed is not None else random.randrange(1, 1_000_000)
+
+    if args.backend_url:
+        url = args.backend_url.rstrip("/")
+    else:
+        server = mock_backend.serve(mock_backend.from_arguments(args))
+        url = f"http://127.0.0.1:{server.server_port}"
+    # 应用和 utils 在导入时读取这些配置，必须在导入之前设置
+    os.environ["SD_API_URL"] = url
+    os.environ["KELING_API_URL"] = url
+    os.environ.setdefault("KELING_AK", "benchmark")
+    os.environ.setdefault("KELING_SK", "benchmark-secret-benchmark-secret")
+    os.environ["IMAGE_CACHE_DIR"] = args.cache_dir or tempfile.mkdtemp(prefix="sd_app_bench_")
+    # AppTest 的所有会话共用同一个 session id，按用户名限流才能区分模拟用户
+    os.environ.setdefault("RATE_LIMIT_SCOPE", "user")
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+
+    from streamlit import logger
+
+    logger.set_log_level("error")
+    if args.app in ("tryon", "both"):
+        # 在主线程导入一次，worker 线程里直接复用
+        from utils import kling_api  # noqa: F401
+
+    rss_start = rss_mb()
+    results = []
+    if args.app in ("flyai", "both"):
+        results.append(run_app("flyai", flyai_user, args))
+    if args.app in ("tryon", "both"):
+        results.append(run_app("virtual_tryon", tryon_user, args))
+    memory = {
+        "rss_start_mb": rss_start,
+        "rss_end_mb": rss_mb(),
+        # Linux 上 ru_maxrss 的单位是 KB
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    # 冷启动耗时：导入、第一次渲染和后台预热，每个进程只记录第一次
+    from utils import startup
+
+    timings = startup.timings()
+    report(results, memory, timings)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results, "memory": memory,
+                       "startup": timings}, f, indent=2, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,26 @@
 import time
+
+# 每次运行的开始时间，用于统计冷启动时的导入和首次渲染耗时
+_run_started = time.perf_counter()
+
 import streamlit as st
 import requests
-import zipfile
-import io
-from utils import icon
-from streamlit_image_select import image_select
+from functools import partial
+from utils import (
+    admission, auth, icon, batch, concurrent_io, executor, gallery, jobs, journal,
+    lazy_download, metrics, sd_api, session_store, startup,
+)
+from utils.catalog import catalog
+from utils.downloads import fetch_image
+from utils.memo import memo, request_key
+from utils.search_index import SEARCH_PAGE_SIZE
+from utils.thumbnails import thumbnails
 import random
+import base64
+import math
+from datetime import timedelta
+
+startup.imported("flyai", time.perf_counter() - _run_started)
 
 # UI configurations
 st.set_page_config(
@@ -13,64 +28,46 @@ st.set_page_config(
 )
 icon.show_icon(":bird:")
 st.markdown("# :rainbow[FlyAI Image Generator]")
+metrics.serve()
 
-CHECKPOINTS_API_URL = "http://43.134.78.67:30000/"
-# 用户名和密码的默认值
-DEFAULT_USERNAME = "admin"
-DEFAULT_PASSWORD = "123@456"
+# session_state / URL 参数中保存当前任务的键
+JOB_KEY = "sd_job"
+BATCH_KEY = "sd_batch"
+# 多页面应用中各页面共用 session_state，画廊条数按页面区分
+GALLERY_LIMIT_KEY = "sd_gallery_limit"
+# session_state 中保存当前搜索条件和页码的键
+SEARCH_KEY = "sd_search"
 
 # Placeholders for images and gallery
 generated_images_placeholder = st.empty()
+batch_placeholder = st.empty()
+search_placeholder = st.empty()
 gallery_placeholder = st.empty()
 
 
-def login_page():
-    with st.form("login_form"):
-        st.title("登录")
-        username = st.text_input("用户名", value="")
-        password = st.text_input("密码", value="", type="password")
-        submit = st.form_submit_button("登录")
-
-        if submit:
-            if username == DEFAULT_USERNAME and password == DEFAULT_PASSWORD:
-                st.success("登录成功！")
-                # 更新会话状态为已登录
-                st.session_state.logged_in = True
-                st.rerun()  # 重新运行脚本以显示主页面
-            else:
-                st.error("用户名或密码错误，请重新输入。")
-
-
-def fetch_checkpoints(api_url: str) -> list:
+def fetch_checkpoints(path: str) -> dict:
     """
-    Fetch checkpoints from the backend API.
+    Fetch checkpoints from every SD node and merge them.
+
+    The result is served from the process-wide catalog cache and only
+    refreshed in the background once it is older than ``CATALOG_TTL``.
 
     Args:
-        api_url (str): The URL of the backend API to fetch checkpoints from.
+        path (str): The API path to fetch checkpoints from.
 
     Returns:
-        list: A list of checkpoints.
+        dict: A mapping of checkpoint name to model version UUID.
     """
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-        # return data.get("checkpoints", [])
-        return {
-            item["name"]: item["model_version_uuid"]
-            for item in data.get("data", []).get("item", [])
-        }
+        return catalog.get(f"sd:{path}", lambda: sd_api.load_checkpoints(path))
     except requests.RequestException as e:
         st.error(f"Failed to fetch checkpoints: {e}")
-        return []
+        return {}
 
 
-def fetch_sampler(api_url: str) -> list:
+def fetch_sampler(path: str) -> list:
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("data", []).get("item", [])
+        return catalog.get(f"sd:{path}", lambda: sd_api.load_sampler(path))
     except requests.RequestException as e:
         st.error(f"Failed to fetch sampler: {e}")
         return []
@@ -84,13 +81,15 @@ def configure_sidebar() -> None:
     including the form for user inputs and the resources section.
     """
 
-    checkpoints = fetch_checkpoints(
-        CHECKPOINTS_API_URL + "/api/v1/model/version/list?type=CHECKPOINT"
+    # 两个目录接口互不依赖，并发拉取
+    checkpoints, simplerlist = concurrent_io.gather(
+        lambda: fetch_checkpoints(sd_api.CHECKPOINTS_PATH),
+        lambda: fetch_sampler(sd_api.SAMPLER_PATH),
     )
 
-    simplerlist = fetch_sampler(CHECKPOINTS_API_URL + "/api/v1/sampler/list")
-
     with st.sidebar:
+        # 表单内的控件修改不会触发重跑，所以模式切换放在表单外
+        batch_mode = st.radio("生成模式", ["单张", "批量"], horizontal=True) == "批量"
         with st.form("my_form"):
             st.info("**Yo fam! Start here ↓**", icon="👋🏾")
             with st.expander(":rainbow[**Refine your output here**]"):
@@ -113,19 +112,48 @@ def configure_sidebar() -> None:
                     max_value=30.0,
                     step=0.1,
                 )
+                # 默认种子每个会话只随机一次；每次重跑都换默认值会让控件被重建，
+                # 用户输入的种子随之丢失
+                if "default_seed" not in st.session_state:
+                    st.session_state.default_seed = random.randint(1, 10000)
                 seed = st.number_input(
                     "随机种子(Seed)",
-                    value=random.randint(1, 10000),
+                    value=st.session_state.default_seed,
                     min_value=-1,
                     step=1,
                     format="%d",
                 )
                 if seed == 0:
                     st.error("随机种子不能为0，请输入其他值。")
-            prompt = st.text_area(
-                ":orange[**Enter prompt: start typing, Shakespeare ✍🏾**]",
-                value="An astronaut riding a rainbow unicorn, cinematic, dramatic",
-            )
+            batch_options = None
+            if batch_mode:
+                prompt = st.text_area(
+                    ":orange[**批量提示词：每行一个**]",
+                    value="An astronaut riding a rainbow unicorn, cinematic, dramatic",
+                )
+                batch_options = {
+                    "prompts_file": st.file_uploader(
+                        "或上传提示词文件 (CSV 需含 prompt 列 / JSONL / JSON 数组)",
+                        type=["csv", "jsonl", "json"],
+                    ),
+                    "seeds": st.text_input(
+                        "随机种子列表", value="", help="例如 1,2,3 或 1-8，留空则使用上面的随机种子"
+                    ),
+                    "cfg_scales": st.text_input(
+                        "CFG scale 列表", value="", help="例如 5,7,9，留空则使用上面的引导词系数"
+                    ),
+                    "max_in_flight": st.slider(
+                        "同时运行的任务数",
+                        value=min(batch.BATCH_MAX_IN_FLIGHT, executor.BACKEND_CONCURRENCY["sd"]),
+                        min_value=1,
+                        max_value=executor.BACKEND_CONCURRENCY["sd"],
+                    ),
+                }
+            else:
+                prompt = st.text_area(
+                    ":orange[**Enter prompt: start typing, Shakespeare ✍🏾**]",
+                    value="An astronaut riding a rainbow unicorn, cinematic, dramatic",
+                )
             negative_prompt = st.text_area(
                 ":orange[**Party poopers you don't want in image? 🙅🏽‍♂️**]",
                 value="the absolute worst quality, distorted features",
@@ -137,6 +165,22 @@ def configure_sidebar() -> None:
                 "Submit", type="primary", use_container_width=True
             )
 
+        # 手动刷新模型/采样器列表（例如后端新增了模型）
+        if st.button("🔄 刷新模型列表", use_container_width=True):
+            catalog.invalidate()
+            st.rerun()
+
+        if len(sd_api.sd_nodes.nodes) > 1:
+            healthy = sum(node["healthy"] for node in sd_api.sd_nodes.status())
+            st.caption(f"推理节点 {healthy}/{len(sd_api.sd_nodes.nodes)} 可用")
+
+        # 按登录用户列出任务日志中的任务，服务重启后也能重新查看运行中或已完成的任务
+        chosen = journal.show_my_jobs("sd", lambda params: params.get("prompt", "")[:60])
+        if chosen is not None and executor.reattach(JOB_KEY, chosen) is None:
+            st.warning("该任务不在当前服务进程中，暂时无法查看。")
+
+        session_store.show_memory_report()
+
         # Credits and resources
         st.divider()
 
@@ -153,8 +197,343 @@ def configure_sidebar() -> None:
             negative_prompt,
             checkPointId,
             clipSkip,
+            batch_options,
+        )
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def show_progress(progress: dict) -> None:
+    """
+    Render the step count, ETA and intermediate preview reported by the backend.
+
+    Malformed fields are skipped, so one bad progress payload never breaks
+    the progress fragment.
+    """
+    details = []
+    step, total_steps = _number(progress.get("step")), _number(progress.get("total_steps"))
+    if step is not None:
+        details.append(
+            f"步数 {step:.0f}/{total_steps:.0f}" if total_steps else f"步数 {step:.0f}/?"
+        )
+    eta = _number(progress.get("eta"))
+    if eta is not None:
+        details.append(f"预计还需 {eta:.0f} 秒")
+    percent = _number(progress.get("percent"))
+    if percent is None and total_steps:
+        percent = 100 * (step or 0) / total_steps
+    if percent is not None:
+        st.progress(max(0, min(int(percent), 100)), text=" · ".join(details) or None)
+    elif details:
+        st.write(" · ".join(details))
+
+    preview = progress.get("preview")
+    if isinstance(preview, str) and preview:
+        try:
+            if not preview.startswith("http"):
+                # 预览图可能是 Base64 字符串
+                preview = base64.b64decode(preview.split(",", 1)[-1], validate=True)
+            st.image(preview, caption="中间预览", width=256)
+        except Exception:
+            # 预览图损坏时不显示，进度照常刷新；片段每秒重跑，不在这里打印日志
+            pass
+
+
+@st.fragment(run_every=jobs.POLL_TICK)
+def job_progress() -> None:
+    """Show the progress of the background job without rerunning the whole page."""
+    job = executor.get(st.session_state.get(JOB_KEY))
+    if job is None or job.done:
+        # 任务结束后整页重跑一次，由 main_page 展示结果并停止刷新
+        st.rerun()
+
+    with st.status("👩🏾‍🍳 Whipping up your words into art...", expanded=True):
+        st.write("⚙️ Model initiated")
+        st.write("🙆‍♀️ Stand up and strecth in the meantime")
+        if job.remote_id:
+            st.write(f"Task UUID: {job.remote_id}")
+        else:
+            ahead = executor.queue_position(job)
+            st.write(f"⏳ 排队中，前面还有 {ahead} 个任务..." if ahead else "⏳ 排队中...")
+        st.write(f"⏱️ 已等待 {job.elapsed:.0f} 秒")
+        if job.tracker is not None:
+            show_progress(job.tracker.progress)
+
+    # 后台已下载完成的图片先显示出来
+    for i, image, image_data, error in sorted(list(job.results), key=lambda r: r[0]):
+        if error is None:
+            st.image(image_data, caption="Generated Image 🎈", use_column_width=True)
+
+
+def show_job_result(job) -> None:
+    """Render the outcome of a finished job: images and ZIP, or the failure."""
+    if job.state != jobs.SUCCEEDED:
+        reason = {
+            jobs.FAILED: "任务失败，请重试。",
+            jobs.CANCELLED: "任务已取消。",
+            jobs.TIMED_OUT: "任务超时，请稍后重试。",
+        }[job.state]
+        st.error(f"{reason} {job.message}", icon="🚨")
+        return
+
+    st.session_state.task_uuid = job.remote_id
+    with st.status("✅ Images generated!", state="complete", expanded=False):
+        st.write(f"Task UUID: {job.remote_id}")
+        if job.info.get("memo") == "hit":
+            st.write("♻️ 与之前的请求完全相同，直接复用了已有结果")
+        if job.info.get("journal") == "replay":
+            st.write("📋 从任务日志中恢复的结果")
+    if job.results:
+        st.toast("Your image has been generated!", icon="😍")
+        show_result(session_store.add_result("sd", job))
+
+
+def show_result(record: dict) -> None:
+    """Render a stored result; images are read from the disk cache by handle."""
+    for i, image, error in record["images"]:
+        if error is None:
+            try:
+                st.image(
+                    session_store.store.load(image),
+                    caption="Generated Image 🎈",
+                    use_column_width=True,
+                )
+                continue
+            except requests.RequestException as e:
+                error = e
+        st.error(
+            f"Failed to fetch image from {image}. Error: {error}",
+            icon="🚨",
         )
 
+    # Create a download button for the zip file, assembled only when requested
+    files = [
+        (f"output_file_{i+1}.png", partial(session_store.store.load, image))
+        for i, image, error in record["images"]
+        if error is None
+    ]
+    lazy_download.download_button(
+        ":red[**Download the Images**]",
+        key=f"sd_{record['job_id']}",
+        build=lambda: lazy_download.build_zip(files, backend="sd"),
+        file_name="output_files.zip",
+        mime="application/zip",
+        use_container_width=True,
+    )
+
+
+def start_batch(payload: dict, batch_options: dict) -> None:
+    """Expand the batch form into payloads and start running them."""
+    try:
+        prompts = batch.parse_prompts(payload["prompt"], batch_options["prompts_file"])
+        seeds = batch.parse_sweep(batch_options["seeds"], int)
+        cfg_scales = batch.parse_sweep(batch_options["cfg_scales"], float)
+    except ValueError as e:
+        st.error(f"批量参数格式错误: {e}", icon="🚨")
+        return
+    if 0 in seeds:
+        st.error("随机种子不能为0，请输入其他值。", icon="🚨")
+        return
+
+    if not prompts:
+        st.error("请至少输入一个提示词。", icon="🚨")
+        return
+    # 展开前先算出组合数，避免超大的组合先占满内存再被拒绝
+    total = len(prompts) * max(len(seeds), 1) * max(len(cfg_scales), 1)
+    if total > batch.BATCH_MAX_JOBS:
+        st.error(
+            f"共 {total} 个组合，超过单次上限 {batch.BATCH_MAX_JOBS}，请缩小范围。",
+            icon="🚨",
+        )
+        return
+    payloads = batch.expand(payload, prompts, seeds, cfg_scales)
+    # 整个批量算一次提交；批量内部由 max_in_flight 控制对后端的并发
+    allowed, reason = admission.admit("sd")
+    if not allowed:
+        st.warning(reason, icon="⏳")
+        return
+
+    previous = st.session_state.get(BATCH_KEY)
+    if previous:
+        batch.discard(previous)
+    current = batch.start("sd", payloads, sd_api.run_txt2img, batch_options["max_in_flight"])
+    st.session_state[BATCH_KEY] = current.id
+    st.query_params[BATCH_KEY] = current.id
+
+
+def show_batch_grid(current) -> None:
+    """Show batch progress and a grid of every image finished so far."""
+    counts = current.counts()
+    finished = sum(counts.get(state, 0) for state in jobs.TERMINAL_STATES)
+    st.progress(
+        finished / len(current.items),
+        text=f"已完成 {finished}/{len(current.items)}，"
+        f"运行中 {counts.get(jobs.RUNNING, 0)}，失败 {counts.get(jobs.FAILED, 0) + counts.get(jobs.TIMED_OUT, 0)}",
+    )
+    cols = st.columns(4)
+    cells = [
+        (item, url) for item in current.items for url in list(item.images)
+    ]
+    for n, (item, url) in enumerate(cells):
+        with cols[n % 4]:
+            st.image(
+                url,
+                caption=f"#{item.index + 1} seed={item.payload['seed']} "
+                f"cfg={item.payload['cfgScale']} · {item.payload['prompt'][:40]}",
+                use_column_width=True,
+            )
+
+
+@st.fragment(run_every=jobs.POLL_TICK)
+def batch_progress() -> None:
+    """Stream batch results into the grid without rerunning the whole page."""
+    current = batch.get(st.session_state.get(BATCH_KEY))
+    if current is None or current.done:
+        st.rerun()
+    st.info(f"🧪 批量生成中，共 {len(current.items)} 个任务", icon="⏳")
+    show_batch_grid(current)
+    if st.button("⏹ 停止批量任务"):
+        current.cancel()
+
+
+def show_batch(current) -> None:
+    """Show a finished batch with its archive and manifest download."""
+    st.success(f"✅ 批量生成结束，共 {len(current.manifest)} 张图片", icon="🎉")
+    show_batch_grid(current)
+    col1, col2 = st.columns(2)
+    with col1:
+        # 压缩包已经在磁盘上，点击后才读取
+        lazy_download.download_button(
+            ":red[**Download the Images + manifest.json**]",
+            key=f"batch_{current.id}",
+            build=lambda: open(current.zip_path, "rb"),
+            file_name="batch_output.zip",
+            mime="application/zip",
+            use_container_width=True,
+        )
+    with col2:
+        if st.button("🧹 清除批量结果", use_container_width=True):
+            batch.discard(current.id)
+            st.session_state.pop(BATCH_KEY, None)
+            if BATCH_KEY in st.query_params:
+                del st.query_params[BATCH_KEY]
+            st.rerun()
+
+
+def _search_page(delta: int) -> None:
+    st.session_state[SEARCH_KEY]["page"] += delta
+
+
+def show_search() -> None:
+    """Search the indexed generation history by prompt, model, sampler, seed and date."""
+    # 关闭了启动预热时，在第一次打开页面时开始同步索引
+    sd_api.history.start()
+    query = st.session_state.get(SEARCH_KEY)
+    with st.expander("🔎 搜索历史作品", expanded=query is not None):
+        with st.form("search_form"):
+            col1, col2 = st.columns(2)
+            keywords = col1.text_input("提示词关键词", placeholder="多个关键词用空格分隔")
+            negative_keywords = col2.text_input("负面提示词关键词")
+            facets = sd_api.history.facets()
+            try:
+                checkpoints = catalog.get(
+                    f"sd:{sd_api.CHECKPOINTS_PATH}",
+                    lambda: sd_api.load_checkpoints(sd_api.CHECKPOINTS_PATH),
+                )
+            except requests.RequestException:
+                # 侧边栏已经提示过错误，这里只显示模型的 UUID
+                checkpoints = {}
+            names = {uuid: name for name, uuid in checkpoints.items()}
+            col1, col2, col3, col4 = st.columns(4)
+            checkpoint = col1.selectbox(
+                "模型",
+                [None] + facets["checkpoint"],
+                format_func=lambda uuid: "全部" if uuid is None else names.get(uuid, uuid),
+            )
+            sampler = col2.selectbox(
+                "采样算法",
+                [None] + facets["sampler"],
+                format_func=lambda sampler: "全部" if sampler is None else sampler,
+            )
+            seed = col3.text_input("随机种子", placeholder="全部")
+            dates = col4.date_input("日期范围", value=(), format="YYYY-MM-DD")
+            if st.form_submit_button("搜索"):
+                if seed.strip() and not seed.strip().lstrip("-").isdigit():
+                    st.error("随机种子必须是整数。")
+                else:
+                    query = st.session_state[SEARCH_KEY] = {
+                        "keywords": keywords,
+                        "negative_keywords": negative_keywords,
+                        "checkpoint": checkpoint,
+                        "sampler": sampler,
+                        "seed": int(seed) if seed.strip() else None,
+                        # 结束日期当天的记录也包含在内
+                        "since": time.mktime(dates[0].timetuple()) if dates else None,
+                        "until": time.mktime((dates[-1] + timedelta(days=1)).timetuple())
+                        if dates
+                        else None,
+                        "page": 1,
+                    }
+
+        if query is None:
+            st.caption(f"已索引 {sd_api.history.count()} 条生成记录")
+            return
+        # 查询只读本地索引，不请求后端
+        started = time.perf_counter()
+        entries, total = sd_api.history.search(**query)
+        elapsed = time.perf_counter() - started
+        pages = max(1, math.ceil(total / SEARCH_PAGE_SIZE))
+        st.caption(
+            f"找到 {total} 条记录，第 {query['page']}/{pages} 页，用时 {elapsed * 1000:.1f} 毫秒"
+        )
+
+        columns = st.columns(4)
+        covers = thumbnails([entry["images"][0] for entry in entries])
+        for n, (entry, cover) in enumerate(zip(entries, covers)):
+            with columns[n % len(columns)]:
+                # 缩略图还没生成时由浏览器直接加载原图
+                st.image(cover or entry["images"][0], use_column_width=True)
+                details = [time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created_at"]))]
+                if entry["seed"] is not None:
+                    details.append(f"Seed {entry['seed']}")
+                if len(entry["images"]) > 1:
+                    details.append(f"共 {len(entry['images'])} 张")
+                st.caption(" · ".join(details))
+                st.caption(entry["prompt"][:100])
+                # 直接下载已有的作品，不必重新生成
+                files = [
+                    (f"output_file_{i+1}.png", partial(fetch_image, image))
+                    for i, image in enumerate(entry["images"])
+                ]
+                lazy_download.download_button(
+                    "Download",
+                    key=f"sd_search_{entry['id']}",
+                    build=lambda files=files: lazy_download.build_zip(files, backend="sd"),
+                    file_name="output_files.zip",
+                    mime="application/zip",
+                )
+
+        col1, col2 = st.columns(2)
+        col1.button(
+            "⬅️ 上一页", on_click=_search_page, args=(-1,), disabled=query["page"] <= 1,
+            use_container_width=True,
+        )
+        col2.button(
+            "下一页 ➡️", on_click=_search_page, args=(1,), disabled=query["page"] >= pages,
+            use_container_width=True,
+        )
+
+
+def start_gallery_listing():
+    """Start loading the gallery entries for this rerun on the shared I/O pool."""
+    limit = st.session_state.setdefault(GALLERY_LIMIT_KEY, gallery.GALLERY_PAGE_SIZE)
+    return concurrent_io.spawn(gallery.service("sd", sd_api.fetch_gallery_page).entries, limit)
+
 
 def main_page(
     submitted: bool,
@@ -169,137 +548,134 @@ def main_page(
     negative_prompt: str,
     checkPointId: str,
     clipSkip: int,
+    batch_options: dict = None,
+    gallery_entries=None,
 ) -> None:
-    if submitted:
-        with st.status(
-            "👩🏾‍🍳 Whipping up your words into art...", expanded=True
-        ) as status:
-            st.write("⚙️ Model initiated")
-            st.write("🙆‍♀️ Stand up and strecth in the meantime")
-            try:
-                with generated_images_placeholder.container():
-                    # 调用后端接口以获取任务的 UUID
-                    response = requests.post(
-                        CHECKPOINTS_API_URL + "/api/v1/sdjob/text2img",
-                        json={
-                            "checkPointId": checkPointId,
-                            "clipSkip": clipSkip,
-                            "width": width,
-                            "height": height,
-                            "imgCount": imgCount,
-                            "scheduler": scheduler,
-                            "steps": steps,
-                            "cfgScale": cfgScale,
-                            "seed": seed,
-                            "prompt": prompt,
-                            "negativePrompt": negative_prompt,
-                        },
-                    )
-                    response.raise_for_status()
-                    task_uuid = response.json().get("data").get("jobUuid")
-                    # task_uuid = "c7cc7d28-1b18-4faa-9de2-de97b3686a75"
-                    st.session_state.task_uuid = task_uuid
-                    st.write(f"Task UUID: {task_uuid}")
-
-                    # 轮询后端接口以获取生成的图片
-                    all_images = []
-                    while True:
-                        result_response = requests.get(
-                            f"{CHECKPOINTS_API_URL}/api/v1/sdjob/result?jobUuid={task_uuid}"
-                        )
-                        result_response.raise_for_status()
-                        result_data = result_response.json()
-                        if result_data.get("data").get("status") == 2:
-                            images = (
-                                result_data.get("data", [])
-                                .get("output", [])
-                                .get("images", [])
-                            )
-                            for image in images:
-                                all_images.append(image.get("imageUrl"))
-                            break
-                        # elif result_data.get("status") == "failed":
-                        #     st.error("任务失败，请重试。")
-                        #     return
-                        time.sleep(1)  # 等待 5 秒后再次轮询
-
-                    result_images = []
-                    if all_images:
-                        st.toast("Your image has been generated!", icon="😍")
-                        st.session_state.generated_image = all_images
-
-                        # Displaying the image
-                        for image in st.session_state.generated_image:
-                            with st.container():
-                                st.image(
-                                    image,
-                                    caption="Generated Image 🎈",
-                                    use_column_width=True,
-                                )
-                                response = requests.get(image)
-                                if response.status_code == 200:
-                                    image_data = response.content
-                                    result_images.append(image_data)
-                                else:
-                                    st.error(
-                                        f"Failed to fetch image from {image}. Error code: {response.status_code}",
-                                        icon="🚨",
-                                    )
-
-                        # Create a BytesIO object
-                        zip_io = io.BytesIO()
-
-                        # Download option for each image
-                        with zipfile.ZipFile(zip_io, "w") as zipf:
-                            for i, image_data in enumerate(result_images):
-                                zipf.writestr(f"output_file_{i+1}.png", image_data)
-
-                        # Create a download button for the zip file
-                        st.download_button(
-                            ":red[**Download the Images**]",
-                            data=zip_io.getvalue(),
-                            file_name="output_files.zip",
-                            mime="application/zip",
-                            use_container_width=True,
-                        )
-                status.update(
-                    label="✅ Images generated!", state="complete", expanded=False
-                )
-            except Exception as e:
-                print(e)
-                st.error(f"Encountered an error: {e}", icon="🚨")
-
-    # If not submitted, chill here 🍹
+    payload = {
+        "checkPointId": checkPointId,
+        "clipSkip": clipSkip,
+        "width": width,
+        "height": height,
+        "imgCount": imgCount,
+        "scheduler": scheduler,
+        "steps": steps,
+        "cfgScale": cfgScale,
+        "seed": seed,
+        "prompt": prompt,
+        "negativePrompt": negative_prompt,
+    }
+    if submitted and batch_options is not None:
+        start_batch(payload, batch_options)
+    elif submitted:
+        # 超过提交频率或后端队列已满时直接提示，不进入队列
+        allowed, reason = admission.admit("sd")
+        if not allowed:
+            st.warning(reason, icon="⏳")
+        # 只把任务放入后台队列，提交、轮询和下载都在后台线程完成
+        elif seed == -1:
+            # 随机种子的结果不可复现，不做缓存
+            job = executor.submit("sd", sd_api.run_txt2img, payload)
+            executor.track(JOB_KEY, job)
+            # 提交参数和之后的状态变化写入任务日志
+            journal.add(job, payload)
+        else:
+            # 完全相同的请求直接复用已有结果，或合并到正在运行的同一任务
+            job = memo.run(request_key("sd", payload), "sd", sd_api.run_txt2img, payload)
+            executor.track(JOB_KEY, job)
+            journal.add(job, payload)
+
+    # 批量任务一直保留到用户清除，方便查看结果和下载
+    current_batch = batch.get(
+        st.session_state.get(BATCH_KEY) or st.query_params.get(BATCH_KEY)
+    )
+    if current_batch is not None:
+        st.session_state[BATCH_KEY] = current_batch.id
+        with batch_placeholder.container():
+            if current_batch.done:
+                show_batch(current_batch)
+            else:
+                batch_progress()
+
+    # 有进行中的任务（包括刷新页面后从 URL 恢复的任务）时继续展示进度，不会重新提交
+    job = executor.resume(JOB_KEY)
+    if job is not None:
+        with generated_images_placeholder.container():
+            if job.done:
+                executor.forget(JOB_KEY)
+                show_job_result(job)
+            else:
+                job_progress()
     else:
-        pass
+        # 没有进行中的任务时继续展示本会话最近一次的结果
+        latest = session_store.results("sd")[:1]
+        if latest:
+            with generated_images_placeholder.container():
+                show_result(latest[0])
+
+    with search_placeholder.container():
+        show_search()
 
     # Gallery display for inspo
     with gallery_placeholder.container():
-        response = requests.get(f"{CHECKPOINTS_API_URL}/api/v1/sdjob/list")
-        response.raise_for_status()
-        data = response.json()
+        sd_gallery = gallery.service("sd", sd_api.fetch_gallery_page)
+        if gallery_entries is None:
+            gallery_entries = start_gallery_listing()
+        try:
+            entries = gallery_entries.result()
+        except requests.RequestException as e:
+            st.error(f"Failed to fetch gallery: {e}", icon="🚨")
+            entries = []
 
         images = []
         captions = []
-        for item in data.get("data"):
-            prompt = item.get("input", {}).get("txt2img", "").get("prompt", "")
-            image_urls = [
-                image.get("imageUrl")
-                for image in item.get("output", {}).get("images", [])
-            ]
-            images.extend(image_urls)
-            captions.extend([prompt] * len(image_urls))
-
-        images = images[:10]
-        captions = captions[:10]
-        img = image_select(
-            label="近期生图记录～ 😉",
-            images=images,
-            captions=captions,
-            use_container_width=True,
-        )
+        for entry in entries:
+            images.extend(entry["images"])
+            captions.extend([entry["caption"]] * len(entry["images"]))
+
+        # 画廊只展示缩略图，尚未生成好的缩略图下次刷新时再显示
+        ready = [
+            (image, thumb, caption)
+            for image, thumb, caption in zip(images, thumbnails(images), captions)
+            if thumb is not None
+        ]
+        if not ready:
+            st.info("🖼️ 近期生图记录的缩略图生成中，请稍后刷新～")
+        else:
+            # 组件导入较慢，登录页用不到，到这里才导入（启动预热时已在后台导入）
+            from streamlit_image_select import image_select
+
+            selected = image_select(
+                label="近期生图记录～ 😉",
+                images=[thumb for _, thumb, _ in ready],
+                captions=[caption for _, _, caption in ready],
+                use_container_width=True,
+                return_value="index",
+            )
+            selected_image = ready[selected][0]
+            # 只有用户要求预览/下载时才读取原图
+            if st.toggle("🔍 查看原图并下载"):
+                try:
+                    image_data = fetch_image(selected_image)
+                except requests.RequestException as e:
+                    st.error(
+                        f"Failed to fetch image from {selected_image}. Error: {e}",
+                        icon="🚨",
+                    )
+                else:
+                    st.image(image_data, caption=ready[selected][2], width=512)
+                    lazy_download.download_button(
+                        "Download Image",
+                        key=f"sd_gallery_{selected_image}",
+                        build=partial(fetch_image, selected_image),
+                        file_name="output_file.png",
+                        mime="image/png",
+                    )
+        if sd_gallery.has_more and st.button("⬇️ 加载更多记录"):
+            st.session_state[GALLERY_LIMIT_KEY] += gallery.GALLERY_PAGE_SIZE
+            st.rerun()
 
 
+@metrics.span("rerun", app="flyai")
 def main():
     """
     Main function to run the Streamlit application.
@@ -308,6 +684,9 @@ def main():
     It retrieves the user inputs from the sidebar, and passes them to the main page function.
     The main page function then generates images based on these inputs.
     """
+    session_store.touch()
+    # 图库列表与模型目录、任务进度互不依赖，先在后台开始拉取
+    gallery_entries = start_gallery_listing()
     (
         submitted,
         width,
@@ -321,6 +700,7 @@ def main():
         negative_prompt,
         checkPointId,
         clipSkip,
+        batch_options,
     ) = configure_sidebar()
     main_page(
         submitted,
@@ -335,15 +715,18 @@ def main():
         negative_prompt,
         checkPointId,
         clipSkip,
+        batch_options,
+        gallery_entries,
     )
 
 
-# 检查会话状态中是否有登录状态，如果没有，初始化为 False
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-
-if __name__ == "__main__":
-    if st.session_state.logged_in:
+# 单独运行时模块名是 __main__，作为 app.py 中的页面运行时是 __page__
+if __name__ in ("__main__", "__page__"):
+    # 进程内第一次运行（通常是登录页）时在后台预热，用户登录后不必再等网络
+    startup.warm_up("flyai", sd_api.warm_catalogs, sd_api.warm_gallery, sd_api.warm_history)
+    if auth.logged_in():
         main()
+        startup.rendered("flyai", "main", time.perf_counter() - _run_started)
     else:
-        login_page()
\ No newline at end of file
+        auth.login_page()
+        startup.rendered("flyai", "login", time.perf_counter() - _run_started)
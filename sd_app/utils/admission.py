@@ -0,0 +1,118 @@
+import math
+import os
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils import executor, metrics
+
+# 每个用户（或会话）每分钟可提交的任务数和允许的突发数量（令牌桶）
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "6"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "3"))
+# 限流维度："session" 按浏览器会话，"user" 按登录用户名
+RATE_LIMIT_SCOPE = os.getenv("RATE_LIMIT_SCOPE", "session")
+# 两次清理空闲令牌桶之间的最短间隔（秒）；已经补满的桶与新建的桶等价，可以直接丢弃
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "60"))
+# 每个后端排队中的任务数上限，超过后直接拒绝新任务
+MAX_QUEUE_LENGTH = {
+    "sd": int(os.getenv("SD_MAX_QUEUE", "50")),
+    "kling": int(os.getenv("KELING_MAX_QUEUE", "20")),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> float:
+        """Take ``cost`` tokens; return 0 on success or the seconds to wait otherwise."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        """Whether the bucket would be back at capacity by ``now``."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class AdmissionController:
+    """Process-wide gate in front of the generation backends.
+
+    Each client gets a token bucket; a backend whose queue already holds
+    ``MAX_QUEUE_LENGTH`` jobs rejects new work outright. Jobs that are
+    admitted wait in the executor queue, whose size per backend is the
+    global concurrency cap.
+    """
+
+    def __init__(
+        self,
+        per_minute: float = RATE_LIMIT_PER_MINUTE,
+        burst: int = RATE_LIMIT_BURST,
+        max_queue: dict = MAX_QUEUE_LENGTH,
+        sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL,
+    ):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_queue = max_queue
+        self.sweep_interval = sweep_interval
+        self.rejected = 0
+        self._buckets = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float) -> None:
+        # 调用方持有 self._lock
+        self._swept_at = now
+        for client in [c for c, bucket in self._buckets.items() if bucket.full(now)]:
+            del self._buckets[client]
+
+    def admit(self, client: str, backend: str, cost: float = 1) -> tuple:
+        """
+        Decide whether ``client`` may submit ``cost`` jobs to ``backend`` now.
+
+        Returns:
+            tuple: ``(allowed, message)``; ``message`` explains a rejection.
+        """
+        queued = executor.queue_length(backend)
+        if queued >= self.max_queue.get(backend, float("inf")):
+            self.rejected += 1
+            return False, f"当前排队任务较多（{queued} 个），请稍后再试。"
+        with self._lock:
+            now = time.monotonic()
+            if now - self._swept_at >= self.sweep_interval:
+                self._sweep(now)
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take(cost)
+        if wait:
+            self.rejected += 1
+            return False, f"提交太频繁，请 {math.ceil(wait)} 秒后再试。"
+        return True, ""
+
+
+def client_id() -> str:
+    """Identify the current browser session or logged-in user for rate limiting."""
+    if RATE_LIMIT_SCOPE == "user" and st.session_state.get("username"):
+        return f"user:{st.session_state.username}"
+    ctx = get_script_run_ctx()
+    return f"session:{ctx.session_id if ctx else 'unknown'}"
+
+
+controller = AdmissionController()
+metrics.register("admission_rejected_total", lambda: controller.rejected)
+metrics.register("admission_buckets", lambda: len(controller._buckets), kind="gauge")
+
+
+def admit(backend: str, cost: float = 1) -> tuple:
+    """Admission check for the current session, see ``AdmissionController.admit``."""
+    return controller.admit(client_id(), backend, cost)
@@ -0,0 +1,39 @@
+import streamlit as st
+
+# 默认账号：用户名 -> 可用的密码。文生图和换装页面原先各有一个默认密码，
+# 共用一个登录入口后两个密码都保留
+DEFAULT_ACCOUNTS = {
+    "admin": ("123@456", "123456"),
+}
+
+
+def logged_in() -> bool:
+    """Whether the current session has logged in, on any page of the app."""
+    return st.session_state.get("logged_in", False)
+
+
+def login_page(accounts: dict = DEFAULT_ACCOUNTS) -> None:
+    """
+    Show the login form and mark the session as logged in on success.
+
+    The login is kept in ``st.session_state``, which every page of the app
+    shares, so a user logs in once per session.
+
+    Args:
+        accounts (dict): Username to a tuple of accepted passwords.
+    """
+    with st.form("login_form"):
+        st.title("登录")
+        username = st.text_input("用户名", value="")
+        password = st.text_input("密码", value="", type="password")
+        submit = st.form_submit_button("登录")
+
+        if submit:
+            if password in accounts.get(username, ()):
+                st.success("登录成功！")
+                # 更新会话状态为已登录
+                st.session_state.logged_in = True
+                st.session_state.username = username
+                st.rerun()  # 重新运行脚本以显示主页面
+            else:
+                st.error("用户名或密码错误，请重新输入。")
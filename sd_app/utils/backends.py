@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils import http_client, metrics
+
+# 健康检查的间隔（秒）、超时（秒）和请求的路径；检查失败的节点不再接收新任务
+HEALTH_CHECK_INTERVAL = float(os.getenv("SD_HEALTH_CHECK_INTERVAL", "15"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("SD_HEALTH_CHECK_TIMEOUT", "3"))
+HEALTH_CHECK_PATH = os.getenv("SD_HEALTH_CHECK_PATH", "/api/v1/sampler/list")
+# 最多记住多少个任务与节点的对应关系
+MAX_PINNED_JOBS = int(os.getenv("SD_MAX_PINNED_JOBS", "10000"))
+# 这些状态码说明节点没有接收请求，换一个节点重新提交不会重复建任务
+FAILOVER_STATUSES = {502, 503, 504}
+
+
+def configured_urls(name: str, default: list) -> list:
+    """
+    Read a list of backend base URLs.
+
+    The environment variable ``name`` (comma separated) wins over the key
+    ``name`` in ``.streamlit/secrets.toml`` (a list or a comma separated
+    string); ``default`` is used when neither is set.
+    """
+    value = os.getenv(name)
+    if value is None:
+        try:
+            import streamlit as st
+
+            value = st.secrets.get(name)
+        except Exception:
+            # 没有 secrets.toml 时读取 st.secrets 会抛异常
+            value = None
+    if isinstance(value, str):
+        value = value.split(",")
+    urls = [url.strip().rstrip("/") for url in value or [] if url.strip()]
+    return urls or [url.rstrip("/") for url in default]
+
+
+class Node:
+    """One inference node and what the pool knows about it."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+        self.checked_at = 0.0
+        self.error = ""
+
+
+class BackendPool:
+    """Process-wide pool of equivalent backend nodes.
+
+    New jobs go to the healthy node with the fewest outstanding jobs, and
+    fail over to the next one when a node cannot be reached. A job stays
+    pinned to the node that accepted it, so it is always polled there.
+    Read-only listings can be fetched from every node at once and merged
+    by the caller. Nodes are health-checked in the background every
+    ``check_interval`` seconds, and marked unhealthy as soon as a request
+    to them fails.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        urls: list,
+        check_interval: float = HEALTH_CHECK_INTERVAL,
+        check_path: str = HEALTH_CHECK_PATH,
+    ):
+        self.name = name
+        self.nodes = [Node(url) for url in urls]
+        self.check_interval = check_interval
+        self.check_path = check_path
+        self._pins = OrderedDict()
+        self._lock = threading.Lock()
+        self._checker = None
+        # 向各节点并发请求用独立的线程池：调用方本身可能就在 concurrent_io 的线程里等待
+        self._fanout = ThreadPoolExecutor(
+            max_workers=max(1, len(self.nodes)), thread_name_prefix=f"{name}-fanout"
+        )
+        for node in self.nodes:
+            metrics.register(
+                "backend_healthy", lambda node=node: int(node.healthy), kind="gauge",
+                pool=name, node=node.url,
+            )
+            metrics.register(
+                "backend_outstanding_jobs", lambda node=node: node.outstanding, kind="gauge",
+                pool=name, node=node.url,
+            )
+
+    def _start_checker(self) -> None:
+        if self._checker is not None or self.check_interval <= 0:
+            return
+        with self._lock:
+            if self._checker is not None:
+                return
+            self._checker = threading.Thread(
+                target=self._check_forever, name=f"{self.name}-health", daemon=True
+            )
+        self._checker.start()
+
+    def _check_forever(self) -> None:
+        while True:
+            for node in self.nodes:
+                self.check(node)
+            time.sleep(self.check_interval)
+
+    def check(self, node: Node) -> bool:
+        """Probe ``node`` once and record whether it is healthy."""
+        try:
+            response = http_client.get(
+                node.url + self.check_path, timeout=HEALTH_CHECK_TIMEOUT
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self._mark(node, e)
+        else:
+            self._mark(node, None)
+        node.checked_at = time.time()
+        return node.healthy
+
+    def _mark(self, node: Node, error) -> None:
+        with self._lock:
+            was_healthy = node.healthy
+            node.healthy = error is None
+            node.error = "" if error is None else str(error)
+            node.failures = 0 if error is None else node.failures + 1
+        if was_healthy != node.healthy:
+            print(f"{self.name} node {node.url} is {'healthy' if node.healthy else 'unhealthy'}")
+            metrics.inc("backend_state_changes_total", pool=self.name, node=node.url)
+
+    def candidates(self) -> list:
+        """Nodes to try for a new job, best first.
+
+        Healthy nodes come first, ordered by outstanding jobs; unhealthy
+        ones are still tried last in case they have recovered.
+        """
+        self._start_checker()
+        with self._lock:
+            return sorted(
+                self.nodes, key=lambda node: (not node.healthy, node.outstanding, node.failures)
+            )
+
+    def submit(self, path: str, **kwargs) -> tuple:
+        """
+        POST a new job to the best node, failing over while nodes are unreachable.
+
+        The chosen node counts the job as outstanding until ``release`` is
+        called for it.
+
+        Args:
+            path (str): API path, e.g. ``"/api/v1/sdjob/text2img"``.
+            **kwargs: Passed through to ``http_client.post``.
+
+        Returns:
+            tuple: ``(node, response)``. Raises the last
+            ``requests.RequestException`` when no node accepted the job.
+        """
+        self._start_checker()
+        tried, error = set(), None
+        while True:
+            with self._lock:
+                remaining = [node for node in self.nodes if node.url not in tried]
+                if not remaining:
+                    raise error
+                node = min(
+                    remaining,
+                    key=lambda node: (not node.healthy, node.outstanding, node.failures),
+                )
+                # 先占位再发请求，同时提交的任务才会分散到不同节点
+                node.outstanding += 1
+            tried.add(node.url)
+            try:
+                response = http_client.post(node.url + path, **kwargs)
+            except requests.ConnectionError as e:
+                # 请求没有到达节点，可以安全地换下一个节点
+                self.release(node)
+                self._mark(node, e)
+                error = e
+                continue
+            except Exception:
+                self.release(node)
+                raise
+            if response.status_code in FAILOVER_STATUSES:
+                self.release(node)
+                self._mark(node, f"HTTP {response.status_code}")
+                error = requests.HTTPError(
+                    f"{response.status_code} from {node.url}", response=response
+                )
+                continue
+            if error is not None:
+                metrics.inc("backend_failovers_total", pool=self.name)
+            return node, response
+
+    def release(self, node: Node) -> None:
+        """Stop counting a job submitted with ``submit`` against ``node``."""
+        with self._lock:
+            node.outstanding = max(0, node.outstanding - 1)
+
+    def pin(self, job_id: str, node: Node) -> None:
+        """Remember that ``job_id`` lives on ``node``."""
+        with self._lock:
+            self._pins[job_id] = node
+            self._pins.move_to_end(job_id)
+            while len(self._pins) > MAX_PINNED_JOBS:
+                self._pins.popitem(last=False)
+
+    def node_for(self, job_id: str):
+        """The node ``job_id`` is pinned to, or None if it is unknown."""
+        with self._lock:
+            return self._pins.get(job_id)
+
+    def get_pinned(self, job_id: str, path: str, **kwargs) -> requests.Response:
+        """
+        GET ``path`` from the node ``job_id`` is pinned to.
+
+        A job submitted by another process is looked up on every node until
+        one knows it (any answer but 404), and pinned there.
+        """
+        node = self.node_for(job_id)
+        if node is not None:
+            return http_client.get(node.url + path, **kwargs)
+        response, error = None, None
+        for node in self.candidates():
+            try:
+                response = http_client.get(node.url + path, **kwargs)
+            except requests.RequestException as e:
+                error = e
+                continue
+            if response.status_code != 404:
+                self.pin(job_id, node)
+                return response
+        if response is None:
+            raise error
+        return response
+
+    def get_all(self, path: str, **kwargs) -> list:
+        """
+        GET ``path`` from every healthy node at once.
+
+        Returns:
+            list: The successful responses, in node order. Nodes that fail are
+            marked unhealthy and skipped; the error is raised only when no
+            node answered.
+        """
+        self._start_checker()
+        nodes = [node for node in self.nodes if node.healthy] or self.nodes
+
+        def fetch(node):
+            response = http_client.get(node.url + path, **kwargs)
+            response.raise_for_status()
+            return response
+
+        futures = [(node, self._fanout.submit(fetch, node)) for node in nodes]
+        responses, error = [], None
+        for node, future in futures:
+            try:
+                responses.append(future.result())
+            except requests.RequestException as e:
+                self._mark(node, e)
+                error = e
+        if not responses and error is not None:
+            raise error
+        return responses
+
+    def status(self) -> list:
+        with self._lock:
+            return [
+                {
+                    "url": node.url,
+                    "healthy": node.healthy,
+                    "outstanding": node.outstanding,
+                    "error": node.error,
+                }
+                for node in self.nodes
+            ]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool(name: str, urls: list) -> BackendPool:
+    """Return the shared pool called ``name``, creating it from ``urls`` on first use."""
+    with _pools_lock:
+        backend_pool = _pools.get(name)
+        if backend_pool is None:
+            backend_pool = _pools[name] = BackendPool(name, urls)
+        return backend_pool
+
+
+def interleave(lists: list) -> list:
+    """Merge newest-first lists from several nodes into one, taking turns."""
+    merged = []
+    for i in range(max((len(items) for items in lists), default=0)):
+        merged.extend(items[i] for items in lists if i < len(items))
+    return merged
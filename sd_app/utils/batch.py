@@ -0,0 +1,337 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+from utils import executor, jobs
+
+# 单个批量任务最多展开的组合数，避免误操作一次提交过多任务
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "500"))
+# 单个批量任务默认同时在后端运行的任务数
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "4"))
+# 已结束的批量任务（及其压缩包）保留的时间（秒）
+BATCH_RETENTION = float(os.getenv("BATCH_RETENTION", "3600"))
+
+# 批量上传（包括 ZIP 内的文件）中作为图片读取的扩展名
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+# CSV/JSONL 中允许覆盖的字段，兼容下划线写法
+_PROMPT_FIELDS = {
+    "prompt": "prompt",
+    "negativePrompt": "negativePrompt",
+    "negative_prompt": "negativePrompt",
+}
+
+
+def parse_prompts(text: str, upload=None) -> list:
+    """
+    Collect prompts from pasted text and an optional uploaded file.
+
+    Args:
+        text (str): One prompt per line; blank lines are ignored.
+        upload: A Streamlit ``UploadedFile`` with either CSV (with a ``prompt``
+            column), JSONL (one object with a ``prompt`` key per line) or a
+            JSON array of such objects.
+            An optional ``negative_prompt``/``negativePrompt`` field overrides
+            the sidebar negative prompt for that row.
+
+    Returns:
+        list: Dicts holding ``prompt`` and optionally ``negativePrompt``.
+    """
+    prompts = [{"prompt": line.strip()} for line in text.splitlines() if line.strip()]
+    if upload is not None:
+        content = upload.getvalue().decode("utf-8-sig")
+        if upload.name.lower().endswith(".json") and content.lstrip().startswith("["):
+            # 普通 JSON 文件：整个文件是一个对象数组
+            rows = json.loads(content)
+            for n, row in enumerate(rows, 1):
+                if not isinstance(row, dict):
+                    raise ValueError(f"item {n}: expected an object")
+        elif upload.name.lower().endswith((".jsonl", ".json")):
+            rows = []
+            for n, line in enumerate(content.splitlines(), 1):
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                # 每行必须是一个对象，字符串、数字或列表都视为输入错误
+                if not isinstance(row, dict):
+                    raise ValueError(f"line {n}: expected an object")
+                rows.append(row)
+        else:
+            rows = list(csv.DictReader(io.StringIO(content)))
+        for row in rows:
+            item = {
+                field: str(row[key]).strip()
+                for key, field in _PROMPT_FIELDS.items()
+                if row.get(key) not in (None, "")
+            }
+            if item.get("prompt"):
+                prompts.append(item)
+    return prompts
+
+
+def read_images(uploads: list) -> list:
+    """
+    Collect the images from uploaded files, expanding ZIP archives.
+
+    Files with the same content are kept only once, under the first name
+    they were seen with.
+
+    Args:
+        uploads (list): Streamlit ``UploadedFile`` objects, images or ZIPs.
+
+    Returns:
+        list: ``(name, bytes)`` pairs in upload order.
+    """
+    images, seen = [], set()
+
+    def add(name, data):
+        digest = hashlib.sha256(data).digest()
+        if digest not in seen:
+            seen.add(digest)
+            images.append((name, data))
+
+    for upload in uploads or []:
+        if upload.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(upload.getvalue())) as archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    # 跳过目录、macOS 打包时附带的元数据和非图片文件
+                    if (
+                        info.is_dir()
+                        or info.filename.startswith("__MACOSX/")
+                        or name.startswith(".")
+                        or not name.lower().endswith(IMAGE_EXTENSIONS)
+                    ):
+                        continue
+                    add(name, archive.read(info))
+        else:
+            add(upload.name, upload.getvalue())
+    return images
+
+
+def parse_sweep(text: str, cast=int, limit: int = BATCH_MAX_JOBS) -> list:
+    """
+    Parse a comma separated sweep such as ``"1,2,5-8"`` or ``"5, 7.5, 9"``.
+
+    Ranges (``a-b``, inclusive) are only allowed for integers.
+
+    Raises:
+        ValueError: If a value is malformed, a range is reversed, or the
+            sweep has more than ``limit`` values.
+    """
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition("-")
+        if sep and start and cast is int:
+            start, end = int(start), int(end)
+            if end < start:
+                raise ValueError(f"{part}: range end is smaller than its start")
+            # 先检查长度再展开，过大的范围不能占满内存
+            if len(values) + end - start + 1 > limit:
+                raise ValueError(f"more than {limit} values")
+            values.extend(range(start, end + 1))
+        else:
+            if len(values) + 1 > limit:
+                raise ValueError(f"more than {limit} values")
+            values.append(cast(part))
+    return values
+
+
+def expand(base: dict, prompts: list, seeds: list, cfg_scales: list) -> list:
+    """Return one txt2img payload per prompt x seed x cfgScale combination."""
+    return [
+        {**base, **prompt, "seed": seed, "cfgScale": cfg_scale}
+        for prompt, seed, cfg_scale in itertools.product(
+            prompts, seeds or [base["seed"]], cfg_scales or [base["cfgScale"]]
+        )
+    ]
+
+
+class BatchItem:
+    def __init__(self, index: int, payload: dict):
+        self.index = index
+        self.payload = payload
+        self.job = None
+        self.images = []
+        self.cancelled = False
+
+    @property
+    def state(self) -> str:
+        if self.cancelled:
+            return jobs.CANCELLED
+        return self.job.state if self.job is not None else jobs.PENDING
+
+
+class Batch:
+    """A set of payloads fanned out to the background executor.
+
+    At most ``max_in_flight`` items run at once. Each finished item's images
+    are written straight into an on-disk ZIP (with a ``manifest.json``
+    mapping every file to its parameters) and then dropped from memory.
+    Files are named after the item's position, or after its payload's
+    ``file_stem`` when it has one.
+    """
+
+    def __init__(self, backend: str, payloads: list, work, max_in_flight: int, on_finish=None):
+        self.id = uuid.uuid4().hex
+        self.backend = backend
+        self.work = work
+        self.on_finish = on_finish
+        self.items = [BatchItem(i, payload) for i, payload in enumerate(payloads)]
+        self.manifest = []
+        self.cancelled = False
+        self.discarded = False
+        self.created_at = time.time()
+        self.finished_at = None
+        fd, self.zip_path = tempfile.mkstemp(prefix="batch-", suffix=".zip")
+        os.close(fd)
+        self._zip = zipfile.ZipFile(self.zip_path, "w", compression=zipfile.ZIP_STORED)
+        self._collected = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        threading.Thread(target=self._dispatch, name="batch-dispatch", daemon=True).start()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def counts(self) -> dict:
+        counts = {}
+        for item in self.items:
+            counts[item.state] = counts.get(item.state, 0) + 1
+        return counts
+
+    def cancel(self) -> None:
+        """Stop dispatching new items; items already running finish normally."""
+        self.cancelled = True
+
+    def _dispatch(self):
+        for item in self.items:
+            self._slots.acquire()
+            if self.cancelled:
+                self._slots.release()
+                item.cancelled = True
+                self._collect(item)
+                continue
+            item.job = executor.submit(self.backend, self._run_item, item)
+
+    def _run_item(self, job, item):
+        item.job = job
+        try:
+            self.work(job, item.payload)
+        except Exception as e:
+            executor.settle(job, e)
+            raise
+        else:
+            # 汇总前先确定任务的最终状态，批量结束时每个单元格都不再是“运行中”
+            executor.settle(job)
+        finally:
+            self._slots.release()
+            self._collect(item)
+
+    def _collect(self, item):
+        with self._lock:
+            if item.job is not None:
+                for i, url, data, error in sorted(item.job.results, key=lambda r: r[0]):
+                    item.images.append(url)
+                    if error is not None:
+                        continue
+                    stem = item.payload.get("file_stem", f"{item.index + 1:04d}")
+                    name = f"{stem}_{i + 1}.png"
+                    self._zip.writestr(name, data)
+                    self.manifest.append(
+                        {
+                            "file": name,
+                            "jobUuid": item.job.remote_id,
+                            "imageUrl": url,
+                            **item.payload,
+                        }
+                    )
+                # 图片已写入压缩包，释放内存
+                item.job.results.clear()
+            self._collected += 1
+            if self._collected == len(self.items):
+                self.manifest.sort(key=lambda entry: entry["file"])
+                self._zip.writestr(
+                    "manifest.json",
+                    json.dumps(self.manifest, ensure_ascii=False, indent=2),
+                )
+                self._zip.close()
+                self.finished_at = time.time()
+                if self.discarded:
+                    os.remove(self.zip_path)
+                if self.on_finish is not None:
+                    self.on_finish()
+
+
+_batches = {}
+_lock = threading.Lock()
+
+
+def _prune() -> None:
+    cutoff = time.time() - BATCH_RETENTION
+    with _lock:
+        expired = [
+            batch_id
+            for batch_id, batch in _batches.items()
+            if batch.finished_at is not None and batch.finished_at < cutoff
+        ]
+    for batch_id in expired:
+        discard(batch_id)
+
+
+def start(
+    backend: str,
+    payloads: list,
+    work,
+    max_in_flight: int = BATCH_MAX_IN_FLIGHT,
+    on_finish=None,
+) -> Batch:
+    """
+    Start running ``work(job, payload)`` for every payload on ``backend``.
+
+    Args:
+        backend (str): Executor pool to run on.
+        payloads (list): Request payloads, one per job.
+        work (callable): Same signature as an ``executor.submit`` worker
+            taking one payload; it must append downloads to ``job.results``.
+        max_in_flight (int): Jobs of this batch allowed to run at once.
+        on_finish (callable): Called without arguments once every item has
+            ended or been cancelled, e.g. to free inputs shared by the jobs.
+
+    Returns:
+        Batch: The running batch.
+    """
+    _prune()
+    batch = Batch(backend, payloads, work, max_in_flight, on_finish)
+    with _lock:
+        _batches[batch.id] = batch
+    return batch
+
+
+def get(batch_id: str):
+    with _lock:
+        return _batches.get(batch_id)
+
+
+def discard(batch_id: str) -> None:
+    """Cancel a batch and delete its archive."""
+    with _lock:
+        batch = _batches.pop(batch_id, None)
+    if batch is not None:
+        batch.cancel()
+        with batch._lock:
+            batch.discarded = True
+            if batch.done:
+                os.remove(batch.zip_path)
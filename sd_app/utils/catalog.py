@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+from utils import metrics
+
+# 模型/采样器列表缓存的有效期（秒），过期后先返回旧值再在后台刷新
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+
+
+class CatalogCache:
+    """Process-wide stale-while-revalidate cache for backend catalog lists.
+
+    Entries are loaded synchronously the first time they are requested. Once
+    an entry is older than ``ttl`` the stale value keeps being served while a
+    background thread fetches a fresh copy, so callers never wait on the
+    network after the cache is warm.
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, loader):
+        """
+        Return the cached value for ``key``, loading it with ``loader`` if needed.
+
+        Args:
+            key (str): Cache key, usually the URL the catalog is fetched from.
+            loader (callable): Zero-argument function returning a fresh value.
+                Exceptions raised on a cold load propagate to the caller.
+
+        Returns:
+            The cached (possibly stale) value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            value = loader()
+            self._store(key, value)
+            return value
+
+        self.hits += 1
+        value, fetched_at = entry
+        if time.monotonic() - fetched_at >= self.ttl:
+            self._refresh_in_background(key, loader)
+        return value
+
+    def invalidate(self, key: str = None) -> None:
+        """Drop one entry, or every entry when ``key`` is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, loader())
+            except Exception as e:
+                # 刷新失败时保留旧值，下次访问再重试
+                print(f"Failed to refresh catalog {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="catalog-refresh", daemon=True).start()
+
+
+catalog = CatalogCache()
+metrics.register("cache_hits_total", lambda: catalog.hits, cache="catalog")
+metrics.register("cache_misses_total", lambda: catalog.misses, cache="catalog")
@@ -0,0 +1,41 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# 页面内并发执行的网络请求（目录、图库列表等）所用的共享线程数
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+
+def _call_with_ctx(ctx, fn, args, kwargs):
+    if ctx is not None:
+        # 让 worker 里的 st.error 等调用仍然归属于发起请求的会话
+        add_script_run_ctx(ctx=ctx)
+    return fn(*args, **kwargs)
+
+
+def spawn(fn, *args, **kwargs) -> Future:
+    """
+    Start ``fn(*args, **kwargs)`` on the shared I/O pool and return its future.
+
+    The page keeps rendering while the request is in flight and calls
+    ``future.result()`` where it needs the value; exceptions are re-raised
+    there.
+    """
+    return _pool.submit(_call_with_ctx, get_script_run_ctx(), fn, args, kwargs)
+
+
+def gather(*calls) -> list:
+    """
+    Run independent zero-argument callables concurrently.
+
+    Returns:
+        list: The results in the order of ``calls``. The first exception
+        raised by a call is re-raised after all of them have finished.
+    """
+    futures = [spawn(call) for call in calls]
+    for future in futures:
+        future.exception()
+    return [future.result() for future in futures]
@@ -0,0 +1,46 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from utils import http_client, metrics
+from utils.image_cache import image_cache
+
+# 并发下载图片的最大线程数
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+
+
+@metrics.span("image_download")
+def _fetch_from_origin(url: str) -> bytes:
+    response = http_client.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+def fetch_image(url: str) -> bytes:
+    """Return the bytes of ``url`` from the local image cache, fetching it once on a miss."""
+    return image_cache.fetch(url, lambda: _fetch_from_origin(url))
+
+
+def download_images(urls: list, max_workers: int = DOWNLOAD_WORKERS):
+    """
+    Download images concurrently and yield them in completion order.
+
+    Args:
+        urls (list): Image URLs to download.
+        max_workers (int): Upper bound on concurrent downloads.
+
+    Yields:
+        tuple: ``(index, url, data, error)`` where ``index`` is the position
+        of ``url`` in ``urls``. Exactly one of ``data`` and ``error`` is set.
+    """
+    if not urls:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as pool:
+        futures = {pool.submit(fetch_image, url): (i, url) for i, url in enumerate(urls)}
+        for future in as_completed(futures):
+            i, url = futures[future]
+            try:
+                yield i, url, future.result(), None
+            except requests.RequestException as e:
+                yield i, url, None, e
@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from utils import jobs, journal, metrics
+from utils.downloads import download_images
+
+# 每个后端同时运行（提交+轮询+取结果）的任务数上限，超出的任务排队等待
+BACKEND_CONCURRENCY = {
+    "sd": int(os.getenv("SD_MAX_CONCURRENCY", "8")),
+    "kling": int(os.getenv("KELING_MAX_CONCURRENCY", "4")),
+}
+# 已结束的任务在内存中保留的时间（秒），超时未被页面取走则丢弃
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "900"))
+
+
+class BackgroundJob:
+    """One unit of work run by the background executor.
+
+    The worker thread updates the fields as the job progresses; Streamlit
+    pages only read them, so no script thread is held while a job runs.
+    """
+
+    def __init__(self, backend: str, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.backend = backend
+        self.state = jobs.PENDING
+        self.remote_id = None
+        self.tracker = None
+        # 按到达顺序追加的 (index, url, data, error)，与 downloads.download_images 一致
+        self.results = []
+        # worker 想在页面上展示的附加信息，例如图片压缩结果
+        self.info = {}
+        self.message = ""
+        # 正在查看该任务的会话数；相同请求合并后多个会话会共享同一个任务
+        self.watchers = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in jobs.TERMINAL_STATES
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.created_at
+
+    def collect_images(self) -> None:
+        """Download the tracker's images that have not been fetched yet."""
+        fetched = {url for _, url, _, _ in self.results}
+        new = [(i, url) for i, url in enumerate(self.tracker.images) if url not in fetched]
+        for n, url, data, error in download_images([url for _, url in new]):
+            if error is None and not any(e is None for _, _, _, e in self.results):
+                metrics.observe(
+                    "time_to_first_image", time.time() - self.created_at, backend=self.backend
+                )
+            self.results.append((new[n][0], url, data, error))
+
+    def on_poll(self, tracker) -> None:
+        """``JobTracker.wait`` callback: fetch new images and journal the progress."""
+        self.collect_images()
+        journal.store.record(self)
+
+
+_pools = {
+    backend: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"{backend}-job")
+    for backend, limit in BACKEND_CONCURRENCY.items()
+}
+_jobs = {}
+_lock = threading.Lock()
+_restored = set()
+
+
+def settle(job: BackgroundJob, error: Exception = None) -> None:
+    """
+    Give ``job`` its final state once its work has returned or raised ``error``.
+
+    Workers that act on the outcome before returning, e.g. batches
+    collecting their items, call this themselves; calling it again is
+    harmless.
+    """
+    if error is not None:
+        job.message = str(error)
+        job.state = jobs.FAILED
+    elif not job.done:
+        job.message = job.message or (job.tracker.message if job.tracker else "")
+        job.state = job.tracker.state if job.tracker else jobs.SUCCEEDED
+
+
+def _run(job: BackgroundJob, work, args) -> None:
+    job.state = jobs.RUNNING
+    job.started_at = time.time()
+    journal.store.record(job)
+    try:
+        work(job, *args)
+    except Exception as e:
+        print(f"Background job {job.id} failed: {e}")
+        settle(job, e)
+    else:
+        settle(job)
+    finally:
+        job.finished_at = time.time()
+        journal.store.record(job)
+        metrics.observe("job_total", job.elapsed, backend=job.backend)
+        metrics.inc("jobs_total", backend=job.backend, state=job.state)
+
+
+def _prune() -> None:
+    cutoff = time.time() - JOB_RETENTION
+    with _lock:
+        for job_id in [
+            job_id
+            for job_id, job in _jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]:
+            del _jobs[job_id]
+
+
+def submit(backend: str, work, *args) -> BackgroundJob:
+    """
+    Queue ``work(job, *args)`` on the pool of ``backend``.
+
+    ``work`` runs on a background thread and must not call Streamlit APIs.
+    It reports progress by updating the job it is given; any exception marks
+    the job as failed.
+
+    Args:
+        backend (str): Pool name, a key of ``BACKEND_CONCURRENCY``.
+        work (callable): The function doing submission, polling and fetching.
+        *args: Extra arguments passed to ``work``.
+
+    Returns:
+        BackgroundJob: The queued job.
+    """
+    _prune()
+    job = BackgroundJob(backend)
+    with _lock:
+        _jobs[job.id] = job
+    _pools[backend].submit(_run, job, work, args)
+    return job
+
+
+def restore(backend: str, work) -> list:
+    """
+    Resume the jobs of ``backend`` that the journal shows as unfinished.
+
+    Runs once per backend and process, when the app starts. A job the
+    backend had accepted keeps its id, so sessions and URLs that still refer
+    to it pick it up again, and ``work(job)`` carries on polling it by its
+    remote id. A job that had not reached the backend yet is marked as
+    failed rather than submitted a second time.
+
+    Returns:
+        list: The restored jobs.
+    """
+    with _lock:
+        if backend in _restored:
+            return []
+        _restored.add(backend)
+    restored = []
+    for entry in journal.store.unfinished(backend):
+        job = BackgroundJob(backend, entry["job_id"])
+        job.remote_id = entry["remote_id"]
+        job.created_at = entry["created_at"]
+        with _lock:
+            _jobs[job.id] = job
+        if job.remote_id:
+            journal.store.resumed(job)
+            _pools[backend].submit(_run, job, work, ())
+            metrics.inc("jobs_resumed_total", backend=backend)
+        else:
+            job.state = jobs.FAILED
+            job.message = "服务重启时任务还未提交到后端，请重新提交。"
+            job.started_at = job.finished_at = time.time()
+            journal.store.resumed(job)
+        restored.append(job)
+    if restored:
+        print(f"Restored {len(restored)} unfinished {backend} jobs from the journal")
+    return restored
+
+
+def completed(backend: str, remote_id: str, results: list, **info) -> BackgroundJob:
+    """Register a job that is already finished, e.g. a result replayed from a cache."""
+    job = BackgroundJob(backend)
+    job.remote_id = remote_id
+    job.results = results
+    job.info.update(info)
+    job.state = jobs.SUCCEEDED
+    job.started_at = job.finished_at = time.time()
+    with _lock:
+        _jobs[job.id] = job
+    return job
+
+
+def reattach(key: str, entry: dict):
+    """
+    Track the journaled job ``entry`` under ``key``, e.g. from "my jobs".
+
+    A job still held by this process is tracked as is; a finished one that
+    has already been dropped is rebuilt from the journal, with its images
+    fetched again from their URLs.
+
+    Returns:
+        BackgroundJob: The tracked job, or None when an unfinished job is
+        not running in this process.
+    """
+    job = get(entry["job_id"])
+    if job is None:
+        if entry["state"] not in jobs.TERMINAL_STATES:
+            return None
+        job = BackgroundJob(entry["backend"], entry["job_id"])
+        job.remote_id = entry["remote_id"]
+        job.state = entry["state"]
+        job.message = entry["message"]
+        job.results = [(i, url, None, None) for i, url in enumerate(entry["images"])]
+        job.created_at = entry["created_at"]
+        job.started_at = job.finished_at = entry["updated_at"]
+        job.info["journal"] = "replay"
+        with _lock:
+            _jobs[job.id] = job
+    track(key, job)
+    return job
+
+
+def queue_length(backend: str) -> int:
+    """Number of jobs of ``backend`` waiting for a free worker."""
+    with _lock:
+        return sum(
+            1 for job in _jobs.values() if job.backend == backend and job.state == jobs.PENDING
+        )
+
+
+def queue_position(job: BackgroundJob) -> int:
+    """Number of jobs queued ahead of ``job`` on its backend; 0 once it has started."""
+    if job.state != jobs.PENDING:
+        return 0
+    with _lock:
+        return sum(
+            1
+            for other in _jobs.values()
+            if other.backend == job.backend
+            and other.state == jobs.PENDING
+            and other.created_at < job.created_at
+        )
+
+
+def get(job_id: str):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def discard(job_id: str) -> None:
+    with _lock:
+        _jobs.pop(job_id, None)
+
+
+def track(key: str, job: BackgroundJob) -> None:
+    """
+    Remember ``job`` for later reruns of this session.
+
+    The job id is stored in ``st.session_state[key]`` and in the URL query
+    parameters, so a browser refresh (a new session in the same process) can
+    pick the running job up again instead of resubmitting it.
+    """
+    if st.session_state.get(key) != job.id:
+        forget(key)
+        with _lock:
+            job.watchers += 1
+    st.session_state[key] = job.id
+    st.query_params[key] = job.id
+
+
+def resume(key: str):
+    """Return the job remembered under ``key``, or None if it is gone."""
+    job_id = st.session_state.get(key) or st.query_params.get(key)
+    job = get(job_id) if job_id else None
+    if job is None:
+        forget(key)
+    else:
+        st.session_state[key] = job.id
+    return job
+
+
+def forget(key: str) -> None:
+    """
+    Stop tracking the job remembered under ``key``.
+
+    A finished job is dropped once nobody watches it. A running one stays
+    registered until ``_prune`` removes it after it ends: identical requests
+    may still join it, and "my jobs" can reattach to it.
+    """
+    job_id = st.session_state.pop(key, None) or st.query_params.get(key)
+    job = get(job_id) if job_id else None
+    if job is not None:
+        with _lock:
+            job.watchers -= 1
+            unwatched = job.watchers <= 0
+        if unwatched and job.done:
+            discard(job_id)
+    if key in st.query_params:
+        del st.query_params[key]
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+# 画廊每页条数、后台检查新记录的最短间隔（秒），以及一次增量刷新最多翻的页数
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "10"))
+GALLERY_REFRESH_INTERVAL = float(os.getenv("GALLERY_REFRESH_INTERVAL", "10"))
+GALLERY_MAX_REFRESH_PAGES = int(os.getenv("GALLERY_MAX_REFRESH_PAGES", "5"))
+
+
+class GalleryService:
+    """Process-wide, incrementally refreshed cache of a backend's job history.
+
+    ``fetch_page(page, page_size)`` returns entries newest first, each a dict
+    with ``id``, ``images`` (list of URLs) and ``caption``. Older pages are
+    fetched only when a page asks for more entries than are cached, and new
+    jobs are picked up by reading from the first page until the newest
+    cached entry (the high-water mark) is seen again. Entries without images
+    (jobs still running) are skipped until they finish.
+    """
+
+    def __init__(
+        self,
+        fetch_page,
+        page_size: int = GALLERY_PAGE_SIZE,
+        refresh_interval: float = GALLERY_REFRESH_INTERVAL,
+    ):
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self._entries = []
+        self._ids = set()
+        self._last_page = 0
+        self._exhausted = False
+        self._refreshed_at = 0.0
+        self._refreshing = False
+        self._lock = threading.RLock()
+
+    @property
+    def has_more(self) -> bool:
+        return not self._exhausted
+
+    def entries(self, limit: int) -> list:
+        """
+        Return up to ``limit`` newest entries.
+
+        Only missing older pages are fetched synchronously. Checking for new
+        jobs happens in the background at most every ``refresh_interval``
+        seconds, so a warm cache never waits on the network.
+        """
+        with self._lock:
+            if self._entries and time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                self._refresh_in_background()
+            while len(self._entries) < limit and not self._exhausted:
+                self._load_older()
+            return self._entries[:limit]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries = []
+            self._ids = set()
+            self._last_page = 0
+            self._exhausted = False
+
+    def _add(self, entries: list, prepend: bool = False) -> None:
+        fresh = []
+        for entry in entries:
+            if entry["images"] and entry["id"] not in self._ids:
+                self._ids.add(entry["id"])
+                fresh.append(entry)
+        self._entries = fresh + self._entries if prepend else self._entries + fresh
+
+    def _load_older(self) -> None:
+        previous = None
+        while True:
+            page = self._last_page + 1
+            entries = self.fetch_page(page, self.page_size)
+            ids = [entry["id"] for entry in entries]
+            unseen = any(job_id not in self._ids for job_id in ids)
+            self._add(entries)
+            self._last_page = page
+            if not self._refreshed_at:
+                self._refreshed_at = time.monotonic()
+            # 不足一页说明到底了；连续两页内容相同说明后端不支持分页
+            if len(entries) < self.page_size or ids == previous:
+                self._exhausted = True
+                return
+            if unseen:
+                return
+            # 新任务插到最前面后各页整体后移，这一页可能全是已缓存的记录，继续往后翻
+            previous = ids
+
+    def _refresh_newer(self) -> None:
+        new_entries = []
+        for page in range(1, GALLERY_MAX_REFRESH_PAGES + 1):
+            entries = self.fetch_page(page, self.page_size)
+            with self._lock:
+                reached_known = any(entry["id"] in self._ids for entry in entries)
+            new_entries.extend(entries)
+            if reached_known or len(entries) < self.page_size:
+                break
+        else:
+            # 新记录太多，直接以最新几页重建缓存
+            with self._lock:
+                self.invalidate()
+                self._add(new_entries)
+                self._last_page = GALLERY_MAX_REFRESH_PAGES
+                return
+        with self._lock:
+            self._add(new_entries, prepend=True)
+
+    def _refresh_in_background(self) -> None:
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def refresh():
+            try:
+                self._refresh_newer()
+            except Exception as e:
+                print(f"Failed to refresh gallery: {e}")
+            finally:
+                with self._lock:
+                    self._refreshed_at = time.monotonic()
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, name="gallery-refresh", daemon=True).start()
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def service(name: str, fetch_page) -> GalleryService:
+    """Return the shared gallery service called ``name``, creating it on first use."""
+    with _services_lock:
+        gallery = _services.get(name)
+        if gallery is None:
+            gallery = _services[name] = GalleryService(fetch_page)
+        else:
+            gallery.fetch_page = fetch_page
+        return gallery
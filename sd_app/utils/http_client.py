@@ -0,0 +1,111 @@
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import metrics
+
+# 连接/读取超时（秒），所有后端请求默认使用，避免请求卡死脚本线程
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+# 5xx 和连接重置时的重试次数与退避系数（0.5 -> 0.5s, 1s, 2s ...）
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+# 每个主机的 keep-alive 连接池大小，可按主机覆盖，例如
+# HTTP_HOST_POOL_SIZES="api.klingai.com=20,43.134.78.67=30"
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+HOST_POOL_SIZES = {
+    host.strip(): int(size)
+    for host, _, size in (
+        item.partition("=")
+        for item in os.getenv("HTTP_HOST_POOL_SIZES", "").split(",")
+        if item.strip()
+    )
+}
+
+_session = requests.Session()
+_mounted = set()
+_lock = threading.Lock()
+
+
+class _CountingRetry(Retry):
+    """Retry that counts every retry attempt per host."""
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        retry = super().increment(method, url, *args, **kwargs)
+        # 重试次数耗尽时 super() 会抛出异常，只统计真正发生的重试
+        pool = kwargs.get("_pool")
+        metrics.inc("http_retries_total", host=pool.host if pool is not None else "")
+        return retry
+
+
+def _retry() -> Retry:
+    # POST 不在默认的可重试方法中：提交任务不是幂等的，5xx 时重试可能重复建任务。
+    # 连接失败（请求尚未发出）对所有方法都会重试。
+    return _CountingRetry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+
+
+def _mount_for(url: str) -> None:
+    parts = urlsplit(url)
+    prefix = f"{parts.scheme}://{parts.netloc}/"
+    if prefix in _mounted:
+        return
+    with _lock:
+        if prefix in _mounted:
+            return
+        pool_size = HOST_POOL_SIZES.get(parts.hostname, POOL_SIZE)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=_retry(),
+        )
+        _session.mount(prefix, adapter)
+        _mounted.add(prefix)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request through the shared keep-alive session.
+
+    Each host gets its own connection pool (see ``HOST_POOL_SIZES``), and
+    every call gets a ``(connect, read)`` timeout unless one is passed.
+
+    Args:
+        method (str): HTTP method, e.g. ``"GET"``.
+        url (str): Absolute URL to request.
+        **kwargs: Passed through to ``requests.Session.request``.
+
+    Returns:
+        requests.Response: The response. Raises ``requests.RequestException``
+        on connection errors, timeouts or exhausted retries.
+    """
+    _mount_for(url)
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    host = urlsplit(url).hostname or ""
+    try:
+        response = _session.request(method, url, **kwargs)
+    except requests.RequestException as e:
+        metrics.inc("http_errors_total", host=host, error=type(e).__name__)
+        raise
+    metrics.inc("http_requests_total", host=host, status=response.status_code)
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
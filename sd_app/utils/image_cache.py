@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from utils import metrics
+
+# 图片缓存目录与容量上限（MB），超过上限时按最近最少使用(LRU)淘汰
+IMAGE_CACHE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sd_app_image_cache")
+)
+IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
+
+
+class ImageCache:
+    """On-disk, content-addressed image cache with LRU eviction.
+
+    Blobs are stored once per SHA-256 of their content; a SQLite index maps
+    each URL to its digest and tracks blob sizes and last access times.
+    Concurrent fetches of the same URL are coalesced so the origin is hit at
+    most once.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_mb: float = IMAGE_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"), check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+            """
+        )
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, url: str):
+        """Return the cached bytes for ``url``, or None on a miss."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest = row[0]
+            self._db.execute(
+                "UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest)
+            )
+            self._db.commit()
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            self._forget_blob(digest)
+            return None
+
+    def put(self, url: str, data: bytes) -> str:
+        """Store ``data`` for ``url`` and return its content digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (digest, size, last_access) VALUES (?, ?, ?)",
+                (digest, len(data), time.time()),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)", (url, digest)
+            )
+            self._db.commit()
+        self._evict()
+        return digest
+
+    def fetch(self, url: str, loader) -> bytes:
+        """
+        Return the bytes for ``url``, calling ``loader()`` only on a miss.
+
+        Args:
+            url (str): Cache key.
+            loader (callable): Zero-argument function fetching the bytes from
+                the origin. Its exceptions propagate to the caller.
+
+        Returns:
+            bytes: The image content.
+        """
+        data = self.get(url)
+        if data is not None:
+            self.hits += 1
+            return data
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        try:
+            with url_lock:
+                # 另一个线程可能刚刚下载完同一个 URL
+                data = self.get(url)
+                if data is not None:
+                    self.hits += 1
+                    return data
+                self.misses += 1
+                data = loader()
+                self.put(url, data)
+                return data
+        finally:
+            with self._lock:
+                self._url_locks.pop(url, None)
+
+    def stored_bytes(self, urls: list) -> int:
+        """Total size on disk of the distinct blobs cached for ``urls``."""
+        if not urls:
+            return 0
+        placeholders = ",".join("?" * len(urls))
+        with self._lock:
+            return self._db.execute(
+                f"""
+                SELECT COALESCE(SUM(size), 0) FROM blobs WHERE digest IN (
+                    SELECT digest FROM urls WHERE url IN ({placeholders})
+                )
+                """,
+                list(urls),
+            ).fetchone()[0]
+
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _forget_blob(self, digest: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._db.commit()
+
+    def _evict(self) -> None:
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for digest, size in self._db.execute(
+                "SELECT digest, size FROM blobs ORDER BY last_access"
+            ):
+                if total <= self.max_bytes:
+                    break
+                victims.append(digest)
+                total -= size
+            for digest in victims:
+                self._db.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+                self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._db.commit()
+        for digest in victims:
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+
+image_cache = ImageCache()
+metrics.register("cache_hits_total", lambda: image_cache.hits, cache="image")
+metrics.register("cache_misses_total", lambda: image_cache.misses, cache="image")
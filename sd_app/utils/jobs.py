@@ -0,0 +1,107 @@
+import os
+import time
+
+import requests
+
+# 轮询间隔：从 POLL_INITIAL_INTERVAL 开始，每次乘以 POLL_BACKOFF，最多 POLL_MAX_INTERVAL 秒
+POLL_INITIAL_INTERVAL = float(os.getenv("POLL_INITIAL_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "10"))
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "1.5"))
+# 单个任务的最长等待时间（秒），超时后不再轮询
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", "600"))
+# 页面进度片段(fragment)的刷新周期，实际请求后端仍按上面的退避间隔
+POLL_TICK = float(os.getenv("POLL_TICK", "1"))
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+TERMINAL_STATES = {SUCCEEDED, FAILED, CANCELLED, TIMED_OUT}
+
+
+class JobTracker:
+    """Poll one backend job with adaptive intervals until it finishes.
+
+    ``fetch_status(job_id)`` must return ``(state, images, message, progress)``
+    where ``state`` is one of the state constants in this module, ``images``
+    lists the image URLs available so far and ``progress`` is a dict with
+    whatever the backend reports (``step``, ``total_steps``, ``eta``,
+    ``percent``, ``preview``). Network errors do not end tracking; the job
+    keeps being polled until ``deadline``.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        fetch_status,
+        deadline: float = JOB_DEADLINE,
+        initial_interval: float = POLL_INITIAL_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        backoff: float = POLL_BACKOFF,
+    ):
+        self.job_id = job_id
+        self.fetch_status = fetch_status
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.state = PENDING
+        self.images = []
+        self.message = ""
+        self.progress = {}
+        self.polls = 0
+        self.started_at = time.time()
+        self.deadline_at = self.started_at + deadline
+        self.interval = initial_interval
+        self.next_poll_at = self.started_at
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    def poll(self) -> str:
+        """Poll the backend once and schedule the next poll."""
+        if self.done:
+            return self.state
+        self.polls += 1
+        try:
+            state, images, message, progress = self.fetch_status(self.job_id)
+        except requests.RequestException as e:
+            self.message = str(e)
+        else:
+            self.state, self.images, self.message = state, images, message
+            self.progress = progress
+
+        now = time.time()
+        if not self.done and now >= self.deadline_at:
+            self.state = TIMED_OUT
+            self.message = f"任务超过 {self.deadline_at - self.started_at:.0f} 秒仍未完成"
+        self.next_poll_at = now + self.interval
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.state
+
+    def poll_if_due(self) -> str:
+        """Poll only if the next scheduled poll time has passed."""
+        if not self.done and time.time() >= self.next_poll_at:
+            self.poll()
+        return self.state
+
+    def wait(self, on_poll=None) -> str:
+        """
+        Block, polling on schedule, until the job reaches a terminal state.
+
+        Args:
+            on_poll (callable): Optional ``on_poll(tracker)`` called after
+                every poll, e.g. to fetch images as soon as they appear.
+        """
+        while not self.done:
+            time.sleep(max(0.0, self.next_poll_at - time.time()))
+            self.poll()
+            if on_poll is not None:
+                on_poll(self)
+        return self.state
+
@@ -0,0 +1,296 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from utils import jobs, metrics
+from utils.image_cache import IMAGE_CACHE_DIR
+
+# 任务日志：每次提交的参数、状态变化和结果地址都写入本地 SQLite，进程重启后据此继续跟踪
+# 未结束的任务。每个进程（Pod）应使用自己的日志文件，多个进程共用时会重复轮询同一任务
+JOB_JOURNAL_PATH = os.getenv(
+    "JOB_JOURNAL_PATH", os.path.join(IMAGE_CACHE_DIR, "jobs.sqlite3")
+)
+# 任务记录保留的天数
+JOB_JOURNAL_RETENTION_DAYS = float(os.getenv("JOB_JOURNAL_RETENTION_DAYS", "30"))
+# “我的任务”中最多列出的条数
+MY_JOBS_LIMIT = int(os.getenv("MY_JOBS_LIMIT", "10"))
+# “我的任务”的时间范围（秒），None 表示不限
+MY_JOBS_PERIODS = {
+    "最近 24 小时": 24 * 3600,
+    "最近 7 天": 7 * 24 * 3600,
+    "全部": None,
+}
+# 任务状态在“我的任务”中的说明
+STATE_LABELS = {
+    jobs.PENDING: "⏳ 排队中",
+    jobs.RUNNING: "🔄 运行中",
+    jobs.SUCCEEDED: "✅ 完成",
+    jobs.FAILED: "❌ 失败",
+    jobs.CANCELLED: "⏹ 已取消",
+    jobs.TIMED_OUT: "⌛ 超时",
+}
+UNFINISHED_STATES = (jobs.PENDING, jobs.RUNNING)
+
+
+def _snapshot(job) -> tuple:
+    """The journaled part of a job: ``(state, remote_id, images, message)``."""
+    state, message = job.state, job.message
+    if not job.done and job.tracker is not None:
+        # 后台线程运行期间以后端报告的状态为准
+        state, message = job.tracker.state, job.tracker.message
+    if job.tracker is not None:
+        images = list(job.tracker.images)
+    else:
+        images = [url for _, url, _, _ in sorted(job.results, key=lambda r: r[0])]
+    return state, job.remote_id, images, message
+
+
+class JobJournal:
+    """Durable log of the jobs submitted from the pages.
+
+    A job is written once with its owner and parameters when it is
+    submitted; every later change of state, remote id, result URLs or
+    message is appended to ``job_events``. The ``jobs`` table also carries
+    each job's latest state, indexed by owner and time for the "my jobs"
+    view and by state to find the jobs to resume after a restart. A job
+    shared by several users (identical requests) has one row per user.
+    """
+
+    def __init__(
+        self, path: str = JOB_JOURNAL_PATH, retention_days: float = JOB_JOURNAL_RETENTION_DAYS
+    ):
+        self.retention = retention_days * 24 * 3600
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下进程崩溃不会丢失已提交的记录，只有断电时可能丢最后几条
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT NOT NULL,
+                username TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                params TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                state TEXT NOT NULL,
+                remote_id TEXT,
+                images TEXT NOT NULL,
+                message TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, username)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_by_user ON jobs (username, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, backend);
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                at REAL NOT NULL,
+                state TEXT NOT NULL,
+                remote_id TEXT,
+                images TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS job_events_by_job ON job_events (job_id, at);
+            """
+        )
+        self._lock = threading.Lock()
+        # 正在记录的任务最后写入的状态，只有变化时才追加事件
+        self._last = {}
+        self.prune()
+
+    def _append(self, job_id: str, snapshot: tuple, now: float) -> None:
+        state, remote_id, images, message = snapshot
+        self._db.execute(
+            "INSERT INTO job_events (job_id, at, state, remote_id, images, message) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, now, state, remote_id, json.dumps(images), message),
+        )
+
+    def add(self, job, username: str, params: dict) -> None:
+        """
+        Journal a job submitted by ``username``.
+
+        Args:
+            job (BackgroundJob): The job returned by the executor.
+            username (str): Owner of the job, listed under their "my jobs".
+            params (dict): JSON-serializable submission parameters.
+        """
+        snapshot = _snapshot(job)
+        state, remote_id, images, message = snapshot
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, username, job.backend, json.dumps(params, ensure_ascii=False),
+                    job.created_at, state, remote_id, json.dumps(images), message, now,
+                ),
+            )
+            if job.id not in self._last:
+                self._append(job.id, snapshot, now)
+                if not job.done:
+                    self._last[job.id] = snapshot
+            self._db.commit()
+
+    def resumed(self, job) -> None:
+        """Record ``job`` again after it was restored from the journal."""
+        with self._lock:
+            self._last[job.id] = None
+        self.record(job)
+
+    def record(self, job) -> None:
+        """Append the job's current state if it changed; unjournaled jobs are ignored."""
+        snapshot = _snapshot(job)
+        now = time.time()
+        with self._lock:
+            if job.id not in self._last:
+                return
+            if snapshot != self._last[job.id]:
+                state, remote_id, images, message = snapshot
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, remote_id = ?, images = ?, message = ?, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (state, remote_id, json.dumps(images), message, now, job.id),
+                )
+                self._append(job.id, snapshot, now)
+                self._db.commit()
+            if job.done:
+                del self._last[job.id]
+            else:
+                self._last[job.id] = snapshot
+
+    def _entries(self, where: str, args: tuple) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, username, backend, params, created_at, state, remote_id, "
+                "images, message, updated_at FROM jobs " + where,
+                args,
+            ).fetchall()
+        return [
+            {
+                "job_id": row[0],
+                "username": row[1],
+                "backend": row[2],
+                "params": json.loads(row[3]),
+                "created_at": row[4],
+                "state": row[5],
+                "remote_id": row[6],
+                "images": json.loads(row[7]),
+                "message": row[8],
+                "updated_at": row[9],
+            }
+            for row in rows
+        ]
+
+    def unfinished(self, backend: str) -> list:
+        """Jobs of ``backend`` that had not finished when they were last recorded, oldest first."""
+        entries = self._entries(
+            "WHERE state IN (?, ?) AND backend = ? ORDER BY created_at",
+            (*UNFINISHED_STATES, backend),
+        )
+        # 多人共享的任务只恢复一次
+        unique = {}
+        for entry in entries:
+            unique.setdefault(entry["job_id"], entry)
+        return list(unique.values())
+
+    def for_user(
+        self, username: str, backend: str = None, since: float = 0, limit: int = MY_JOBS_LIMIT
+    ) -> list:
+        """
+        Jobs submitted by ``username``, newest first.
+
+        Args:
+            username (str): Owner of the jobs.
+            backend (str): Only jobs of this backend when given.
+            since (float): Only jobs created at or after this Unix time.
+            limit (int): Maximum number of jobs returned.
+        """
+        where = "WHERE username = ? AND created_at >= ?"
+        args = (username, since)
+        if backend is not None:
+            where += " AND backend = ?"
+            args += (backend,)
+        return self._entries(where + " ORDER BY created_at DESC LIMIT ?", args + (limit,))
+
+    def events(self, job_id: str) -> list:
+        """The recorded history of ``job_id``, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT at, state, remote_id, images, message FROM job_events "
+                "WHERE job_id = ? ORDER BY at, id",
+                (job_id,),
+            ).fetchall()
+        return [
+            {
+                "at": at,
+                "state": state,
+                "remote_id": remote_id,
+                "images": json.loads(images),
+                "message": message,
+            }
+            for at, state, remote_id, images, message in rows
+        ]
+
+    def prune(self) -> None:
+        """Drop the jobs and events older than the retention period."""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE created_at < ?", (cutoff,))
+            self._db.execute("DELETE FROM job_events WHERE at < ?", (cutoff,))
+            self._db.commit()
+
+    def tracked_count(self) -> int:
+        with self._lock:
+            return len(self._last)
+
+
+store = JobJournal()
+metrics.register("journal_tracked_jobs", store.tracked_count, kind="gauge")
+
+
+def add(job, params: dict) -> None:
+    """Journal ``job`` under the logged-in user of the current session."""
+    store.add(job, st.session_state.get("username", ""), params)
+
+
+def show_my_jobs(backend: str, describe) -> dict:
+    """
+    Sidebar list of the current user's jobs of ``backend``, newest first.
+
+    Args:
+        backend (str): Backend whose jobs are listed.
+        describe (callable): ``describe(params)`` returning a short text for
+            a job, e.g. its prompt.
+
+    Returns:
+        dict: The journal entry the user chose to view, or None.
+    """
+    username = st.session_state.get("username")
+    if not username:
+        return None
+    chosen = None
+    with st.expander("📋 我的任务"):
+        period = st.selectbox("时间范围", list(MY_JOBS_PERIODS), key=f"my_jobs_period_{backend}")
+        seconds = MY_JOBS_PERIODS[period]
+        since = time.time() - seconds if seconds is not None else 0
+        entries = store.for_user(username, backend, since)
+        if not entries:
+            st.caption("暂无任务记录")
+        for entry in entries:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.caption(
+                    f"{time.strftime('%m-%d %H:%M', time.localtime(entry['created_at']))} "
+                    f"{STATE_LABELS.get(entry['state'], entry['state'])}"
+                )
+                st.write(describe(entry["params"]) or "-")
+            with col2:
+                if st.button("查看", key=f"my_jobs_{entry['job_id']}"):
+                    chosen = entry
+    return chosen
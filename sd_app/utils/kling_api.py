@@ -0,0 +1,143 @@
+# 可灵虚拟试穿接口，各页面共用。这里的函数也在后台线程（任务、缓存刷新、预热）中运行，
+# 不能调用 Streamlit
+import base64
+import os
+
+from utils import executor, gallery, jobs, kling_auth, metrics
+from utils.preprocess import PreparedInputs, prepare_image
+from utils.thumbnails import thumbnails
+
+# 可灵 API 地址，可通过环境变量指向本地模拟服务
+KELING_API_URL = os.getenv("KELING_API_URL", "https://api.klingai.com")
+AK = os.getenv("KELING_AK", "")
+SK = os.getenv("KELING_SK", "")
+# 可灵接口返回的任务状态
+KELING_TASK_STATES = {
+    "submitted": jobs.PENDING,
+    "processing": jobs.RUNNING,
+    "succeed": jobs.SUCCEEDED,
+    "failed": jobs.FAILED,
+}
+
+
+# 将图片编码为 Base64 格式
+def get_base64_of_bin_file(data):
+    return base64.b64encode(data).decode()
+
+
+@metrics.span("job_poll", backend="kling")
+def fetch_task_status(task_id: str) -> tuple:
+    """
+    Fetch the current state of a try-on task.
+
+    Returns:
+        tuple: ``(state, image_urls, message, progress)`` as expected by
+        ``JobTracker``; Kling does not report progress.
+    """
+    response = kling_auth.request(
+        "GET", f"{KELING_API_URL}/v1/images/kolors-virtual-try-on/{task_id}", AK, SK
+    )
+    response.raise_for_status()
+    data = response.json().get("data") or {}
+    state = KELING_TASK_STATES.get(data.get("task_status"), jobs.RUNNING)
+    images = [
+        image.get("url")
+        for image in (data.get("task_result") or {}).get("images", [])
+    ]
+    return state, images, data.get("task_status_msg", ""), {}
+
+
+def _submit_tryon(job, model_name: str, human_image: str, cloth_image: str) -> None:
+    """Submit Base64 encoded inputs, wait for the task and download its images."""
+    # 支持传入图片Base64编码或图片URL
+    with metrics.span("job_submit", backend="kling"):
+        response = kling_auth.request(
+            "POST",
+            KELING_API_URL + "/v1/images/kolors-virtual-try-on",
+            AK,
+            SK,
+            json={
+                "model_name": model_name,
+                "human_image": human_image,
+                "cloth_image": cloth_image,
+            },
+        )
+        response.raise_for_status()
+    job.remote_id = response.json().get("data").get("task_id")
+    track_tryon(job)
+
+
+def track_tryon(job) -> None:
+    """Poll an accepted try-on task until it finishes and download its images (background thread)."""
+    job.tracker = jobs.JobTracker(job.remote_id, fetch_task_status)
+    job.tracker.wait(on_poll=job.on_poll)
+
+
+def run_tryon(job, model_name: str, human_image: bytes, cloth_image: bytes) -> None:
+    """Submit a try-on task, wait for it and download its images (background thread)."""
+    # 先纠正方向、缩小尺寸并重新压缩，再编码为 Base64，减少上传体积
+    human_image, human_stats = prepare_image(human_image)
+    cloth_image, cloth_stats = prepare_image(cloth_image)
+    job.info["preprocess"] = [("人物图片", human_stats), ("衣服图片", cloth_stats)]
+    _submit_tryon(
+        job, model_name, get_base64_of_bin_file(human_image), get_base64_of_bin_file(cloth_image)
+    )
+
+
+def run_tryon_pair(job, payload: dict, inputs: PreparedInputs) -> None:
+    """Run one cell of a batch; each input is prepared and encoded once per batch."""
+    try:
+        human_image, human_stats = inputs.get(payload["human_image"])
+    except Exception:
+        # 这个单元格不会再取衣服图片，归还它的使用次数
+        inputs.release(payload["cloth_image"])
+        raise
+    cloth_image, cloth_stats = inputs.get(payload["cloth_image"])
+    job.info["preprocess"] = [("人物图片", human_stats), ("衣服图片", cloth_stats)]
+    _submit_tryon(job, payload["model_name"], human_image, cloth_image)
+
+
+@metrics.span("gallery_fetch", backend="kling")
+def fetch_gallery_page(page: int, page_size: int) -> list:
+    """
+    Fetch one page of try-on task history for the gallery, newest first.
+
+    Returns:
+        list: Entries with ``id``, ``images`` and ``caption`` as expected by
+        ``GalleryService``.
+    """
+    response = kling_auth.request(
+        "GET",
+        f"{KELING_API_URL}/v1/images/kolors-virtual-try-on",
+        AK,
+        SK,
+        params={"pageNum": page, "pageSize": page_size},
+    )
+    response.raise_for_status()
+    return [
+        {
+            "id": task.get("task_id"),
+            "images": [
+                image.get("url")
+                for image in (task.get("task_result") or {}).get("images", [])
+            ],
+            "caption": "",
+        }
+        for task in response.json().get("data") or []
+    ]
+
+
+def warm_gallery() -> None:
+    """Load the first gallery page and start building its thumbnails (background thread)."""
+    entries = gallery.service("kling", fetch_gallery_page).entries(gallery.GALLERY_PAGE_SIZE)
+    thumbnails([image for entry in entries for image in entry["images"]])
+
+
+def warm_token() -> None:
+    """Sign the first Kling token ahead of the first request (background thread)."""
+    if AK and SK:
+        kling_auth.tokens.token(AK, SK)
+
+
+# 上次进程退出时还没结束的任务按任务日志继续轮询，不重新提交
+executor.restore("kling", track_tryon)
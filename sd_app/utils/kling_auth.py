@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+import requests
+
+from utils import http_client
+
+# 可灵 JWT 的有效期（秒），以及在过期前多少秒提前换新，避免长时间轮询中途过期
+KELING_TOKEN_TTL = int(os.getenv("KELING_TOKEN_TTL", "1800"))
+KELING_TOKEN_RENEW_MARGIN = float(os.getenv("KELING_TOKEN_RENEW_MARGIN", "300"))
+
+
+def encode_jwt_token(ak: str, sk: str, ttl: int = KELING_TOKEN_TTL) -> str:
+    # 只在第一次签发令牌时导入
+    import jwt
+
+    headers = {
+        "alg": "HS256",
+        "typ": "JWT"
+    }
+    payload = {
+        "iss": ak,
+        "exp": int(time.time()) + ttl,  # 有效时间，默认当前时间+1800s(30min)
+        "nbf": int(time.time()) - 5  # 开始生效的时间，此处示例代表当前时间-5秒
+    }
+    return jwt.encode(payload, sk, headers=headers)
+
+
+class TokenProvider:
+    """Thread-safe per-AK cache of Kling JWTs.
+
+    A cached token is reused until ``renew_margin`` seconds before its
+    ``exp``, then a new one is signed.
+    """
+
+    def __init__(self, ttl: int = KELING_TOKEN_TTL, renew_margin: float = KELING_TOKEN_RENEW_MARGIN):
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def token(self, ak: str, sk: str) -> str:
+        with self._lock:
+            cached = self._tokens.get(ak)
+            if cached is not None and time.time() < cached[1] - self.renew_margin:
+                return cached[0]
+            token = encode_jwt_token(ak, sk, self.ttl)
+            self._tokens[ak] = (token, int(time.time()) + self.ttl)
+            return token
+
+    def invalidate(self, ak: str) -> None:
+        with self._lock:
+            self._tokens.pop(ak, None)
+
+
+tokens = TokenProvider()
+
+
+def request(method: str, url: str, ak: str, sk: str, **kwargs) -> requests.Response:
+    """
+    Send an authorised Kling request through the shared HTTP client.
+
+    If the API answers 401 the cached token is dropped and the request is
+    retried once with a freshly signed token.
+    """
+    headers = kwargs.pop("headers", {})
+
+    def send():
+        token = tokens.token(ak, sk)
+        return http_client.request(
+            method, url, headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs
+        )
+
+    response = send()
+    if response.status_code == 401:
+        tokens.invalidate(ak)
+        response = send()
+    return response
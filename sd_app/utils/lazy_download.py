@@ -0,0 +1,96 @@
+import tempfile
+import zipfile
+
+import streamlit as st
+
+from utils import metrics
+
+
+def _prepare(flag: str) -> None:
+    st.session_state[flag] = True
+
+
+def _reset(flag: str) -> None:
+    st.session_state.pop(flag, None)
+
+
+def download_button(
+    label: str,
+    key: str,
+    build,
+    file_name: str,
+    mime: str,
+    prepare_label: str = "📦 准备下载",
+    **kwargs,
+) -> None:
+    """
+    A download button whose payload is only produced when it is asked for.
+
+    ``st.download_button`` needs its data up front, so every rerun would
+    otherwise fetch or assemble files nobody downloads. This shows a
+    "prepare" button first; once clicked, ``build()`` runs and the real
+    download button is shown until the file has been downloaded, after
+    which Streamlit releases the payload again.
+
+    Args:
+        label (str): Label of the download button.
+        key (str): Unique key of this download, e.g. derived from a job id.
+        build (callable): Zero-argument function returning bytes or a
+            binary file object positioned at the start; the file is closed
+            after it has been read.
+        file_name (str): Name of the downloaded file.
+        mime (str): MIME type of the payload.
+        prepare_label (str): Label of the button that prepares the payload.
+        **kwargs: Passed to both buttons, e.g. ``use_container_width``.
+    """
+    flag = f"download_prepared_{key}"
+    data = None
+    if st.session_state.get(flag, False):
+        try:
+            data = build()
+            if hasattr(data, "read"):
+                # st.download_button 只接受部分文件类型，且无论如何都会整体读入媒体文件管理器
+                with data:
+                    data = data.read()
+        except Exception as e:
+            # 准备失败时回到“准备下载”按钮，否则之后每次重跑都会再次失败，页面其余部分也无法显示
+            print(f"Failed to prepare download {key}: {e}")
+            st.error(f"准备下载失败：{e}", icon="🚨")
+            _reset(flag)
+            data = None
+    if data is None:
+        st.button(
+            prepare_label, key=f"{flag}_prepare", on_click=_prepare, args=(flag,), **kwargs
+        )
+    else:
+        st.download_button(
+            label,
+            data=data,
+            file_name=file_name,
+            mime=mime,
+            key=f"{flag}_download",
+            on_click=_reset,
+            args=(flag,),
+            **kwargs,
+        )
+
+
+def build_zip(files, backend: str = "") -> "tempfile.SpooledTemporaryFile":
+    """
+    Write ``(name, load)`` pairs into a ZIP one file at a time.
+
+    Each ``load()`` is called only while its entry is written, and the
+    archive spills to disk beyond a few MB, so the images are never all in
+    memory at once. PNGs are already compressed and stored as-is.
+
+    Returns:
+        A file object positioned at the start of the archive.
+    """
+    archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with metrics.span("zip_build", backend=backend), zipfile.ZipFile(
+        archive, "w", compression=zipfile.ZIP_STORED
+    ) as zipf:
+        for name, load in files:
+            zipf.writestr(name, load())
+    archive.seek(0)
+    return archive
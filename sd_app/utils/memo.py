@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils import executor, jobs, metrics
+from utils.downloads import download_images
+from utils.image_cache import IMAGE_CACHE_DIR
+
+# 相同请求结果的缓存：有效期（秒）与最多保留条数，超出后淘汰最久未使用的
+RESULT_MEMO_PATH = os.getenv(
+    "RESULT_MEMO_PATH", os.path.join(IMAGE_CACHE_DIR, "results.sqlite3")
+)
+RESULT_MEMO_TTL = float(os.getenv("RESULT_MEMO_TTL", str(7 * 24 * 3600)))
+RESULT_MEMO_MAX_ENTRIES = int(os.getenv("RESULT_MEMO_MAX_ENTRIES", "10000"))
+
+
+def _canonical(value):
+    if isinstance(value, float):
+        # 7 和 7.0 视为同一个参数
+        return int(value) if value.is_integer() else round(value, 6)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def request_key(namespace: str, payload: dict) -> str:
+    """Return a stable key for a request payload, independent of key order and number formatting."""
+    canonical = json.dumps(
+        _canonical(payload), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(f"{namespace}:{canonical}".encode()).hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultMemo:
+    """Persistent map from a request key to the image URLs it produced.
+
+    Entries expire after ``ttl`` seconds; beyond ``max_entries`` the least
+    recently used ones are evicted. Requests already running are tracked in
+    memory so identical submissions share one backend job.
+    """
+
+    def __init__(
+        self,
+        path: str = RESULT_MEMO_PATH,
+        ttl: float = RESULT_MEMO_TTL,
+        max_entries: int = RESULT_MEMO_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                remote_id TEXT,
+                images TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access);
+            """
+        )
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get(self, key: str):
+        """Return ``{"remote_id", "images"}`` for a fresh entry, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT remote_id, images FROM results WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+        return {"remote_id": row[0], "images": json.loads(row[1])}
+
+    def put(self, key: str, remote_id: str, images: list) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, remote_id, json.dumps(images), now, now),
+            )
+            self._db.execute(
+                "DELETE FROM results WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._db.execute(
+                """
+                DELETE FROM results WHERE key IN (
+                    SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._db.commit()
+
+    def run(self, key: str, backend: str, work, *args):
+        """
+        Run ``work`` through the executor unless an identical request is known.
+
+        A memoised result is replayed immediately from the image cache; an
+        identical request that is still running is shared instead of being
+        submitted again. Otherwise ``work(job, *args)`` is queued and its
+        image URLs are recorded once it succeeds.
+
+        Returns:
+            BackgroundJob: The job to track in the page.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            results = list(download_images(entry["images"]))
+            if all(error is None for _, _, _, error in results):
+                self.hits += 1
+                return executor.completed(
+                    backend, entry["remote_id"], results, memo="hit"
+                )
+            # 源站图片已失效，重新生成
+            self.forget(key)
+
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None and not job.done:
+                self.coalesced += 1
+                return job
+            self.misses += 1
+            job = executor.submit(backend, self._run_and_record, key, work, args)
+            self._inflight[key] = job
+        return job
+
+    def _run_and_record(self, job, key, work, args):
+        try:
+            work(job, *args)
+            if job.tracker is not None and job.tracker.state == jobs.SUCCEEDED:
+                self.put(key, job.remote_id, job.tracker.images)
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is job:
+                    del self._inflight[key]
+
+
+memo = ResultMemo()
+metrics.register("cache_hits_total", lambda: memo.hits, cache="result")
+metrics.register("cache_misses_total", lambda: memo.misses, cache="result")
+metrics.register("cache_coalesced_total", lambda: memo.coalesced, cache="result")
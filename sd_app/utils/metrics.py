@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from streamlit.runtime.scriptrunner.exceptions import ScriptControlException
+
+# Prometheus 指标端口（0 表示不开启）与监听地址；两个应用分开运行时请使用不同端口
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 为 1 时每个耗时阶段结束后额外输出一行 JSON 日志
+METRICS_JSON_LOG = os.getenv("METRICS_JSON_LOG", "0").lower() in ("1", "true", "yes")
+# 耗时直方图的桶（秒），覆盖从单次请求到整个生成任务的范围
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600
+)
+PREFIX = "sd_app_"
+
+logger = logging.getLogger("sd_app.metrics")
+if METRICS_JSON_LOG and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Registry:
+    """Process-wide counters and latency histograms in Prometheus text format.
+
+    Timings are recorded into one histogram, ``stage_seconds``, labelled by
+    stage; counters are free-form. Components that already keep their own
+    counters (caches) register a collector that is read at scrape time.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        """Record ``seconds`` for ``stage`` in the ``stage_seconds`` histogram."""
+        key = _label_key({"stage": stage, **labels})
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+        if METRICS_JSON_LOG:
+            logger.info(
+                json.dumps(
+                    {"ts": time.time(), "stage": stage, "seconds": round(seconds, 6), **labels},
+                    ensure_ascii=False,
+                )
+            )
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Time the enclosed block as ``stage``; exceptions also bump ``stage_errors_total``."""
+        start = time.perf_counter()
+        try:
+            yield
+        except ScriptControlException:
+            # st.rerun()/st.stop() 通过异常实现，属于正常的控制流，不计为错误
+            raise
+        except Exception:
+            self.inc("stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def register(self, name: str, collect, kind: str = "counter", **labels) -> None:
+        """Expose the value returned by ``collect()`` under ``name`` at scrape time.
+
+        ``kind`` is the Prometheus type, ``"counter"`` or ``"gauge"``.
+        """
+        with self._lock:
+            self._types[name] = kind
+            self._collectors.append((name, _label_key(labels), collect))
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+            collectors = list(self._collectors)
+            types = dict(self._types)
+        for name, key, collect in collectors:
+            try:
+                counters[(name, key)] = collect()
+            except Exception as e:
+                print(f"Failed to collect metric {name}: {e}")
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {PREFIX}{name} {types.get(name, 'counter')}")
+            for (counter, key), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{PREFIX}{name}{_format_labels(key)} {value}")
+        if histograms:
+            name = f"{PREFIX}stage_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, total, count) in sorted(histograms.items()):
+                for bound, bucket in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {bucket}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+span = registry.span
+register = registry.register
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port: int = METRICS_PORT, host: str = METRICS_HOST) -> None:
+    """Start the ``/metrics`` endpoint once per process; a no-op when ``port`` is 0."""
+    global _server
+    if not port:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError as e:
+            print(f"Failed to start metrics endpoint on {host}:{port}: {e}")
+            return
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
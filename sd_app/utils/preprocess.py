@@ -0,0 +1,117 @@
+import base64
+import io
+import os
+import threading
+from concurrent.futures import Future
+
+# 试穿输入图片的最长边（像素，超过模型可用分辨率的部分只会增加上传体积）和 JPEG 质量
+TRYON_MAX_SIDE = int(os.getenv("TRYON_MAX_SIDE", "1536"))
+TRYON_JPEG_QUALITY = int(os.getenv("TRYON_JPEG_QUALITY", "90"))
+
+
+def prepare_image(
+    data: bytes, max_side: int = TRYON_MAX_SIDE, quality: int = TRYON_JPEG_QUALITY
+) -> tuple:
+    """
+    Normalise an uploaded photo before it is base64 encoded for upload.
+
+    The EXIF orientation is applied to the pixels, the image is downscaled so
+    its longest side is at most ``max_side`` and it is re-encoded as JPEG.
+    If nothing had to change and the original is already smaller, the
+    original bytes are kept.
+
+    Args:
+        data (bytes): The uploaded file content.
+        max_side (int): Longest side in pixels after resizing.
+        quality (int): JPEG quality used for re-encoding.
+
+    Returns:
+        tuple: ``(bytes, stats)`` where ``stats`` holds the original and
+        resulting byte counts and pixel sizes.
+    """
+    # PIL 导入较慢，只在真正处理图片时导入
+    from PIL import Image, ImageOps
+
+    original = Image.open(io.BytesIO(data))
+    original_size = original.size
+    # EXIF Orientation (0x0112) 不为 1 时需要把旋转应用到像素上
+    changed = original.getexif().get(0x0112, 1) != 1
+    image = ImageOps.exif_transpose(original)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        changed = True
+
+    if image.mode in ("RGBA", "LA", "P"):
+        # 透明背景按白色合成，JPEG 不支持透明通道
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    result = buffer.getvalue()
+    if not changed and len(result) >= len(data):
+        result = data
+    return result, {
+        "original_bytes": len(data),
+        "bytes": len(result),
+        "original_size": original_size,
+        "size": image.size,
+    }
+
+
+class PreparedInputs:
+    """Prepare and base64 encode each input of a batch exactly once.
+
+    ``load(key)`` returns the raw bytes of an input; ``uses`` says how many
+    jobs will ask for each key. Concurrent requests for the same key wait
+    for the first one instead of preparing the image again, and an encoded
+    input is dropped once its last job has taken it. Jobs that will not ask
+    for a key after all hand their use back with ``release``; ``clear``
+    drops everything once the batch is over.
+    """
+
+    def __init__(self, load, uses: dict):
+        self.load = load
+        self._uses = dict(uses)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple:
+        """
+        Return ``(base64_str, stats)`` for the input stored under ``key``.
+
+        ``stats`` is the dict returned by ``prepare_image``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = Future()
+        if owner:
+            try:
+                data, stats = prepare_image(self.load(key))
+                entry.set_result((base64.b64encode(data).decode(), stats))
+            except Exception as e:
+                entry.set_exception(e)
+        try:
+            return entry.result()
+        finally:
+            self.release(key)
+
+    def release(self, key: str) -> None:
+        """Give back one use of ``key``, dropping its encoded input after the last one."""
+        with self._lock:
+            self._uses[key] = self._uses.get(key, 1) - 1
+            if self._uses[key] <= 0:
+                # 最后一个用到它的任务已经取走，释放编码结果
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every encoded input, e.g. when the batch has ended."""
+        with self._lock:
+            self._uses.clear()
+            self._entries.clear()
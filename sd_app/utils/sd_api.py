@@ -0,0 +1,252 @@
+# SD 推理节点的访问接口，各页面共用。这里的函数也在后台线程（任务、缓存刷新、预热）中运行，
+# 不能调用 Streamlit
+import os
+from datetime import datetime
+
+from utils import backends, executor, gallery, jobs, metrics, search_index
+from utils.catalog import catalog
+from utils.thumbnails import thumbnails
+
+# SD 后端地址，可通过环境变量指向其他部署或本地模拟服务
+CHECKPOINTS_API_URL = os.getenv("SD_API_URL", "http://43.134.78.67:30000/")
+# 多个推理节点时通过 SD_API_URLS（环境变量逗号分隔，或 secrets.toml 中的列表）配置，
+# 未配置时只使用上面一个节点
+SD_API_URLS = backends.configured_urls("SD_API_URLS", [CHECKPOINTS_API_URL])
+sd_nodes = backends.pool("sd", SD_API_URLS)
+# 模型和采样器列表接口
+CHECKPOINTS_PATH = "/api/v1/model/version/list?type=CHECKPOINT"
+SAMPLER_PATH = "/api/v1/sampler/list"
+# 后端 progress 字段的单位："fraction"（0~1）、"percent"（0~100），
+# 或 "auto"：0~1 之间的小数按比例处理，整数和更大的数按百分比处理
+SD_PROGRESS_SCALE = os.getenv("SD_PROGRESS_SCALE", "auto")
+# sdjob 接口返回的任务状态码
+SD_JOB_STATES = {
+    0: jobs.PENDING,
+    1: jobs.RUNNING,
+    2: jobs.SUCCEEDED,
+    3: jobs.FAILED,
+    4: jobs.CANCELLED,
+}
+
+
+@metrics.span("catalog_fetch", catalog="checkpoints")
+def load_checkpoints(path: str) -> dict:
+    # 各节点上的模型可能不同，合并成一个列表
+    checkpoints = {}
+    for response in sd_nodes.get_all(path):
+        data = response.json()
+        # return data.get("checkpoints", [])
+        for item in data.get("data", []).get("item", []):
+            checkpoints.setdefault(item["name"], item["model_version_uuid"])
+    return checkpoints
+
+
+@metrics.span("catalog_fetch", catalog="sampler")
+def load_sampler(path: str) -> list:
+    samplers = []
+    for response in sd_nodes.get_all(path):
+        data = response.json()
+        samplers.extend(
+            item for item in data.get("data", []).get("item", []) if item not in samplers
+        )
+    return samplers
+
+
+def _percent(value):
+    """Progress in percent, or None when the backend reported nothing usable."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if not isinstance(value, (int, float)):
+        return None
+    if SD_PROGRESS_SCALE == "fraction" or (
+        SD_PROGRESS_SCALE == "auto" and isinstance(value, float) and value <= 1
+    ):
+        # 整数 1 表示 1%，只有 0~1 的小数才按比例换算
+        return value * 100
+    return value
+
+
+@metrics.span("job_poll", backend="sd")
+def fetch_job_status(job_uuid: str) -> tuple:
+    """
+    Fetch the current state of a txt2img job.
+
+    Images already finished in a multi-image job are returned while the job
+    is still running, together with any progress the backend reports. The
+    job is polled on the node that accepted it.
+
+    Returns:
+        tuple: ``(state, image_urls, message, progress)`` as expected by
+        ``JobTracker``.
+    """
+    response = sd_nodes.get_pinned(job_uuid, f"/api/v1/sdjob/result?jobUuid={job_uuid}")
+    response.raise_for_status()
+    data = response.json().get("data") or {}
+    state = SD_JOB_STATES.get(data.get("status"), jobs.RUNNING)
+    images = [
+        image.get("imageUrl")
+        for image in (data.get("output") or {}).get("images", [])
+        if image.get("imageUrl")
+    ]
+    progress = {
+        "percent": data.get("progress"),
+        "step": data.get("step", data.get("currentStep")),
+        "total_steps": data.get("totalSteps"),
+        "eta": data.get("eta", data.get("etaRelative")),
+        "preview": data.get("previewImage", data.get("currentImage")),
+    }
+    progress["percent"] = _percent(progress["percent"])
+    progress = {key: value for key, value in progress.items() if value is not None}
+    return state, images, data.get("message", ""), progress
+
+
+def run_txt2img(job, payload: dict) -> None:
+    """Submit a txt2img job, wait for it and download its images (background thread)."""
+    with metrics.span("job_submit", backend="sd"):
+        # 提交到未完成任务最少的健康节点，节点不可用时自动换下一个
+        node, response = sd_nodes.submit("/api/v1/sdjob/text2img", json=payload)
+    try:
+        response.raise_for_status()
+        job.remote_id = response.json().get("data").get("jobUuid")
+        # 之后的轮询都发往接收任务的节点
+        sd_nodes.pin(job.remote_id, node)
+        job.info["node"] = node.url
+        track_txt2img(job)
+    finally:
+        sd_nodes.release(node)
+    if job.tracker.state == jobs.SUCCEEDED:
+        # 本进程提交的任务参数齐全，完成后立即可以搜索到
+        history.add(
+            [
+                history_entry(
+                    {
+                        "jobUuid": job.remote_id,
+                        "input": {"txt2img": payload},
+                        "output": {"images": [{"imageUrl": url} for url in job.tracker.images]},
+                    }
+                )
+            ]
+        )
+
+
+def track_txt2img(job) -> None:
+    """Poll an accepted txt2img job until it finishes and download its images (background thread)."""
+    job.tracker = jobs.JobTracker(job.remote_id, fetch_job_status)
+    # 每次轮询后立即下载新出现的图片并写入任务日志，多图任务不必等全部完成
+    job.tracker.wait(on_poll=job.on_poll)
+
+
+def _fetch_history(page: int, page_size: int) -> list:
+    """One page of raw job history from every SD node, merged newest first."""
+    pages = []
+    for response in sd_nodes.get_all(
+        "/api/v1/sdjob/list", params={"page": page, "pageSize": page_size}
+    ):
+        data = response.json().get("data") or []
+        if isinstance(data, dict):
+            data = data.get("item", [])
+        pages.append(data)
+    return backends.interleave(pages)
+
+
+def _timestamp(value):
+    """Unix time from the creation time of a history item (seconds, milliseconds or a date string)."""
+    if value in (None, ""):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        try:
+            return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return value / 1000 if value > 1e11 else value
+
+
+def history_entry(item: dict) -> dict:
+    """A search index entry for one job of the history."""
+    params = (item.get("input") or {}).get("txt2img", {})
+    seed = params.get("seed")
+    return {
+        "id": item.get("jobUuid"),
+        "prompt": params.get("prompt", ""),
+        "negative_prompt": params.get("negativePrompt", ""),
+        "checkpoint": params.get("checkPointId"),
+        "sampler": params.get("scheduler"),
+        # -1 表示随机种子，实际使用的种子未知
+        "seed": int(seed) if seed not in (None, "", -1, "-1") else None,
+        "created_at": _timestamp(
+            item.get("createTime", item.get("createdAt", item.get("gmtCreate")))
+        ),
+        "images": [
+            image.get("imageUrl")
+            for image in (item.get("output") or {}).get("images", [])
+            if image.get("imageUrl")
+        ],
+    }
+
+
+def fetch_history_page(page: int, page_size: int) -> list:
+    """One page of job history as search index entries, newest first."""
+    return [history_entry(item) for item in _fetch_history(page, page_size)]
+
+
+# 历史作品搜索索引，由画廊读到的记录、本进程完成的任务和后台同步逐步填充
+history = search_index.index("sd", fetch_history_page)
+
+
+@metrics.span("gallery_fetch", backend="sd")
+def fetch_gallery_page(page: int, page_size: int) -> list:
+    """
+    Fetch one page of job history for the gallery, newest first.
+
+    The same page is fetched from every SD node and the entries are merged.
+    The jobs are also added to the search index on the way.
+
+    Returns:
+        list: Entries with ``id``, ``images`` and ``caption`` as expected by
+        ``GalleryService``.
+    """
+    items = _fetch_history(page, page_size)
+    # 画廊已经下载了这一页，顺便写入搜索索引，不必再单独请求
+    history.add([history_entry(item) for item in items])
+    entries = []
+    for item in items:
+        image_urls = [
+            image.get("imageUrl")
+            for image in (item.get("output") or {}).get("images", [])
+        ]
+        entries.append(
+            {
+                "id": item.get("jobUuid") or (image_urls[0] if image_urls else None),
+                "images": image_urls,
+                "caption": (item.get("input") or {}).get("txt2img", {}).get("prompt", ""),
+            }
+        )
+    return entries
+
+
+def warm_catalogs() -> None:
+    """Load the checkpoint and sampler catalogs into the cache (background thread)."""
+    catalog.get(f"sd:{CHECKPOINTS_PATH}", lambda: load_checkpoints(CHECKPOINTS_PATH))
+    catalog.get(f"sd:{SAMPLER_PATH}", lambda: load_sampler(SAMPLER_PATH))
+
+
+def warm_history() -> None:
+    """Start keeping the search index in sync with the job history (background thread)."""
+    history.start()
+
+
+def warm_gallery() -> None:
+    """Load the first gallery page and start building its thumbnails (background thread)."""
+    entries = gallery.service("sd", fetch_gallery_page).entries(gallery.GALLERY_PAGE_SIZE)
+    thumbnails([image for entry in entries for image in entry["images"]])
+
+
+# 上次进程退出时还没结束的任务按任务日志继续轮询，不重新提交
+executor.restore("sd", track_txt2img)
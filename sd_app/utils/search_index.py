@@ -0,0 +1,326 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils import metrics
+from utils.image_cache import IMAGE_CACHE_DIR
+
+# 历史作品搜索索引所在目录，每个后端一个 SQLite 文件
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", IMAGE_CACHE_DIR)
+# 后台同步历史记录的间隔（秒），以及每次同步时请求的每页条数
+SEARCH_SYNC_INTERVAL = float(os.getenv("SEARCH_SYNC_INTERVAL", "60"))
+SEARCH_SYNC_PAGE_SIZE = int(os.getenv("SEARCH_SYNC_PAGE_SIZE", "50"))
+# 检查新记录时最多翻的页数，以及每次同步最多回填的更早的页数
+SEARCH_SYNC_MAX_PAGES = int(os.getenv("SEARCH_SYNC_MAX_PAGES", "5"))
+SEARCH_BACKFILL_PAGES = int(os.getenv("SEARCH_BACKFILL_PAGES", "5"))
+# 搜索结果每页条数
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "8"))
+# trigram 分词器只能匹配至少 3 个字符的关键词，更短的关键词改用 LIKE
+MIN_MATCH_LENGTH = 3
+
+COLUMNS = (
+    "id", "prompt", "negative_prompt", "checkpoint", "sampler", "seed", "created_at", "images",
+)
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class SearchIndex:
+    """Local full-text index over a backend's generation history.
+
+    Entries are dicts with ``id``, ``prompt``, ``negative_prompt``,
+    ``checkpoint``, ``sampler``, ``seed``, ``created_at`` (Unix time) and
+    ``images`` (list of URLs). Prompts are indexed with SQLite FTS5 and a
+    trigram tokenizer, so keywords match anywhere in a prompt, in any
+    language; the other fields are plain indexed columns used as filters.
+
+    The index is filled incrementally: ``add`` takes whatever entries the
+    app already fetched, and ``sync`` reads the history from
+    ``fetch_page(page, page_size)`` (newest first) until it meets a known
+    job, then backfills a few older pages per call until the history is
+    exhausted. ``start`` runs ``sync`` periodically in the background.
+    Entries are written once; jobs without images are skipped until they
+    finish.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fetch_page=None,
+        sync_interval: float = SEARCH_SYNC_INTERVAL,
+        page_size: int = SEARCH_SYNC_PAGE_SIZE,
+    ):
+        self.fetch_page = fetch_page
+        self.sync_interval = sync_interval
+        self.page_size = page_size
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                prompt TEXT NOT NULL,
+                negative_prompt TEXT NOT NULL,
+                checkpoint TEXT,
+                sampler TEXT,
+                seed INTEGER,
+                created_at REAL NOT NULL,
+                images TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at);
+            CREATE INDEX IF NOT EXISTS entries_checkpoint ON entries (checkpoint, created_at);
+            CREATE INDEX IF NOT EXISTS entries_sampler ON entries (sampler, created_at);
+            CREATE INDEX IF NOT EXISTS entries_seed ON entries (seed);
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+                prompt, negative_prompt, content='entries', content_rowid='rowid',
+                tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts (rowid, prompt, negative_prompt)
+                VALUES (new.rowid, new.prompt, new.negative_prompt);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts (entries_fts, rowid, prompt, negative_prompt)
+                VALUES ('delete', old.rowid, old.prompt, old.negative_prompt);
+            END;
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self._lock = threading.Lock()
+        self._syncer = None
+
+    def add(self, entries: list) -> int:
+        """Index the finished jobs among ``entries``; returns how many were new."""
+        rows = [
+            (
+                entry["id"],
+                entry.get("prompt") or "",
+                entry.get("negative_prompt") or "",
+                entry.get("checkpoint"),
+                entry.get("sampler"),
+                entry.get("seed"),
+                entry.get("created_at") or time.time(),
+                json.dumps(entry["images"]),
+            )
+            for entry in entries
+            if entry.get("id") and entry.get("images")
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            ids = [row[0] for row in rows]
+            known = {
+                row[0]
+                for row in self._db.execute(
+                    f"SELECT id FROM entries WHERE id IN ({', '.join('?' * len(ids))})", ids
+                )
+            }
+            new = {row[0]: row for row in rows if row[0] not in known}
+            self._db.executemany(
+                f"INSERT INTO entries ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                list(new.values()),
+            )
+            self._db.commit()
+        return len(new)
+
+    def _known(self, ids: list) -> bool:
+        with self._lock:
+            return any(
+                self._db.execute("SELECT 1 FROM entries WHERE id = ?", (job_id,)).fetchone()
+                for job_id in ids
+            )
+
+    def _state(self, key: str, default: int = 0) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_state(self, **values) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?)", list(values.items())
+            )
+            self._db.commit()
+
+    def sync(self) -> int:
+        """
+        Index new history, then backfill older pages.
+
+        Returns:
+            int: Number of newly indexed entries.
+        """
+        added = 0
+        if self.count():
+            for page in range(1, SEARCH_SYNC_MAX_PAGES + 1):
+                entries = self.fetch_page(page, self.page_size)
+                reached_known = self._known([entry["id"] for entry in entries])
+                added += self.add(entries)
+                if reached_known or len(entries) < self.page_size:
+                    break
+            else:
+                # 新记录太多，与已有记录之间可能有空缺，从这里继续回填
+                self._set_state(backfill_page=SEARCH_SYNC_MAX_PAGES, exhausted=0)
+
+        if not self._state("exhausted"):
+            page = self._state("backfill_page")
+            previous = None
+            for _ in range(SEARCH_BACKFILL_PAGES):
+                entries = self.fetch_page(page + 1, self.page_size)
+                ids = [entry["id"] for entry in entries]
+                # 后端不支持分页时每页内容相同，也视为到底
+                if not entries or ids == previous:
+                    self._set_state(exhausted=1)
+                    break
+                page, previous = page + 1, ids
+                added += self.add(entries)
+                if len(entries) < self.page_size:
+                    self._set_state(exhausted=1)
+                    break
+            self._set_state(backfill_page=page)
+        return added
+
+    @property
+    def backfilled(self) -> bool:
+        return bool(self._state("exhausted"))
+
+    def start(self) -> None:
+        """Sync now and then every ``sync_interval`` seconds on a background thread."""
+        if self._syncer is not None or self.fetch_page is None:
+            return
+        with self._lock:
+            if self._syncer is not None:
+                return
+            self._syncer = threading.Thread(
+                target=self._sync_forever, name="search-sync", daemon=True
+            )
+        self._syncer.start()
+
+    def _sync_forever(self) -> None:
+        while True:
+            try:
+                with metrics.span("search_sync"):
+                    added = self.sync()
+                if added:
+                    print(f"Search index: {added} new entries, {self.count()} in total")
+            except Exception as e:
+                print(f"Failed to sync search index: {e}")
+            # 回填未完成时尽快继续，之后按间隔检查新记录
+            time.sleep(self.sync_interval if self.backfilled else 1)
+
+    def search(
+        self,
+        keywords: str = "",
+        negative_keywords: str = "",
+        checkpoint: str = None,
+        sampler: str = None,
+        seed: int = None,
+        since: float = None,
+        until: float = None,
+        page: int = 1,
+        page_size: int = SEARCH_PAGE_SIZE,
+    ) -> tuple:
+        """
+        Find indexed jobs, newest first.
+
+        Every whitespace separated keyword must occur in the prompt (or, for
+        ``negative_keywords``, in the negative prompt), ignoring case; the
+        other arguments are exact filters and are ignored when None.
+
+        Args:
+            since (float): Only jobs created at or after this Unix time.
+            until (float): Only jobs created before this Unix time.
+            page (int): 1-based page of results.
+            page_size (int): Results per page.
+
+        Returns:
+            tuple: ``(entries, total)``, the entries of the requested page and
+            the number of matching jobs.
+        """
+        started = time.perf_counter()
+        match, where, args = [], [], []
+        for column, text in (("prompt", keywords), ("negative_prompt", negative_keywords)):
+            for term in (text or "").split():
+                if len(term) >= MIN_MATCH_LENGTH:
+                    match.append(f"{column} : {_phrase(term)}")
+                else:
+                    where.append(f"{column} LIKE ? ESCAPE '\\'")
+                    args.append(_like(term))
+        if match:
+            where.insert(0, "rowid IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)")
+            args.insert(0, " AND ".join(match))
+        for column, value in (("checkpoint", checkpoint), ("sampler", sampler), ("seed", seed)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            args.append(until)
+        condition = " WHERE " + " AND ".join(where) if where else ""
+
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM entries{condition}", args).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM entries{condition} "
+                "ORDER BY created_at DESC, rowid DESC LIMIT ? OFFSET ?",
+                args + [page_size, (max(page, 1) - 1) * page_size],
+            ).fetchall()
+        metrics.observe("search_query", time.perf_counter() - started)
+        entries = [dict(zip(COLUMNS, row)) for row in rows]
+        for entry in entries:
+            entry["images"] = json.loads(entry["images"])
+        return entries, total
+
+    def facets(self) -> dict:
+        """The distinct checkpoints and samplers in the index, for filter choices."""
+        with self._lock:
+            return {
+                column: [
+                    row[0]
+                    for row in self._db.execute(
+                        f"SELECT DISTINCT {column} FROM entries "
+                        f"WHERE {column} IS NOT NULL ORDER BY {column}"
+                    )
+                ]
+                for column in ("checkpoint", "sampler")
+            }
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def index(name: str, fetch_page=None) -> SearchIndex:
+    """Return the shared search index called ``name``, creating it on first use."""
+    with _indexes_lock:
+        search_index = _indexes.get(name)
+        if search_index is None:
+            search_index = _indexes[name] = SearchIndex(
+                os.path.join(SEARCH_INDEX_DIR, f"search_{name}.sqlite3"), fetch_page
+            )
+            metrics.register(
+                "search_index_entries", search_index.count, kind="gauge", index=name
+            )
+        elif fetch_page is not None:
+            search_index.fetch_page = fetch_page
+        return search_index
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.uploaded_file_manager import UploadedFile
+
+from utils import metrics
+from utils.downloads import fetch_image
+from utils.image_cache import image_cache
+
+# 每个会话最多保留的生成结果条数，超出后丢弃最早的
+SESSION_MAX_RESULTS = int(os.getenv("SESSION_MAX_RESULTS", "20"))
+# 会话空闲多久（秒）后清除它保存的结果引用
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# 两次清理空闲会话之间的最短间隔（秒）
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# 不是来自某个 URL 的数据（例如上传的图片）在图片缓存中使用的键前缀
+BLOB_PREFIX = "blob:"
+
+
+class SessionStore:
+    """Process-wide, per-session record of generated results.
+
+    Image bytes are never held here: each result refers to its images by
+    handle, the key under which the bytes live in the on-disk image cache
+    (the image URL, or ``blob:<sha256>`` for uploads). Each session keeps at
+    most ``max_results`` results, and sessions idle for longer than
+    ``idle_ttl`` seconds are dropped.
+    """
+
+    def __init__(
+        self,
+        max_results: int = SESSION_MAX_RESULTS,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL,
+    ):
+        self.max_results = max_results
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self._sessions = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id: str) -> dict:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {
+                "last_seen": time.time(),
+                "results": [],
+                "blobs": set(),
+            }
+        return session
+
+    def touch(self, session_id: str) -> None:
+        """Mark ``session_id`` as active and drop idle sessions when due."""
+        with self._lock:
+            self._session(session_id)["last_seen"] = time.time()
+        if time.monotonic() - self._swept_at >= self.sweep_interval:
+            self.sweep()
+
+    def sweep(self) -> None:
+        cutoff = time.time() - self.idle_ttl
+        with self._lock:
+            self._swept_at = time.monotonic()
+            for session_id in [
+                session_id
+                for session_id, session in self._sessions.items()
+                if session["last_seen"] < cutoff
+            ]:
+                del self._sessions[session_id]
+                self.evicted += 1
+
+    def put_blob(self, session_id: str, data: bytes) -> str:
+        """Spill ``data`` to the disk cache and return its handle."""
+        handle = BLOB_PREFIX + hashlib.sha256(data).hexdigest()
+        image_cache.put(handle, data)
+        with self._lock:
+            self._session(session_id)["blobs"].add(handle)
+        return handle
+
+    def load(self, handle: str):
+        """Return the bytes behind ``handle``; evicted images are fetched again from their URL."""
+        data = image_cache.get(handle)
+        if data is None and not handle.startswith(BLOB_PREFIX):
+            data = fetch_image(handle)
+        return data
+
+    def add_result(self, session_id: str, kind: str, job) -> dict:
+        """Record the images of a finished job by handle and return the record.
+
+        The job's bytes are not kept.
+        """
+        record = {
+            "job_id": job.id,
+            "remote_id": job.remote_id,
+            "kind": kind,
+            "created_at": time.time(),
+            "images": [
+                (i, url, None if error is None else str(error))
+                for i, url, _, error in sorted(job.results, key=lambda r: r[0])
+            ],
+        }
+        with self._lock:
+            results = self._session(session_id)["results"]
+            for existing in results:
+                if existing["job_id"] == job.id:
+                    return existing
+            results.append(record)
+            del results[:-self.max_results]
+        return record
+
+    def results(self, session_id: str, kind: str = None) -> list:
+        """The results of ``session_id``, newest first."""
+        with self._lock:
+            results = list(self._sessions.get(session_id, {}).get("results", []))
+        return [r for r in reversed(results) if kind is None or r["kind"] == kind]
+
+    def _usage(self, session_id: str, session: dict, now: float) -> dict:
+        # 调用方持有 self._lock；磁盘占用在锁外查询
+        urls = [url for r in session["results"] for _, url, error in r["images"] if not error]
+        return {
+            "session_id": session_id,
+            "idle_seconds": now - session["last_seen"],
+            "results": len(session["results"]),
+            "handles": set(urls) | set(session["blobs"]),
+        }
+
+    def usage(self, session_id: str):
+        """Usage of one session (see ``report``), or None if it is unknown."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            usage = self._usage(session_id, session, now)
+        usage["disk_bytes"] = image_cache.stored_bytes(list(usage["handles"]))
+        usage["handles"] = len(usage["handles"])
+        return usage
+
+    def report(self) -> list:
+        """Per-session usage: result count, handles and bytes they occupy on disk.
+
+        Queries the disk cache once per session, so it is meant for
+        occasional diagnostics, not for every rerun.
+        """
+        now = time.time()
+        with self._lock:
+            sessions = [
+                self._usage(session_id, session, now)
+                for session_id, session in self._sessions.items()
+            ]
+        for usage in sessions:
+            usage["disk_bytes"] = image_cache.stored_bytes(list(usage["handles"]))
+            usage["handles"] = len(usage["handles"])
+        return sessions
+
+    def session_count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+store = SessionStore()
+metrics.register("sessions", store.session_count, kind="gauge")
+metrics.register("sessions_evicted_total", lambda: store.evicted)
+
+
+def session_id() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "unknown"
+
+
+def _approx_size(value) -> int:
+    if isinstance(value, UploadedFile):
+        return value.size
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_approx_size(v) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_approx_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def session_state_bytes() -> int:
+    """Rough in-memory size of the current session's ``st.session_state``."""
+    return sum(_approx_size(st.session_state[key]) for key in st.session_state)
+
+
+def touch() -> None:
+    store.touch(session_id())
+
+
+def put_blob(data: bytes) -> str:
+    return store.put_blob(session_id(), data)
+
+
+def add_result(kind: str, job) -> dict:
+    return store.add_result(session_id(), kind, job)
+
+
+def results(kind: str = None) -> list:
+    return store.results(session_id(), kind)
+
+
+def show_memory_report() -> None:
+    """Sidebar summary of what the current session keeps in memory and on disk."""
+    # 每次重跑只查询当前会话的磁盘占用，其他会话只显示内存中的计数
+    usage = store.usage(session_id())
+    with st.expander("🧠 会话内存"):
+        st.write(f"会话状态约 {session_state_bytes() / 1024:.0f} KB")
+        if usage is not None:
+            st.write(
+                f"保存了 {usage['results']} 条结果（最多 {store.max_results} 条），"
+                f"磁盘缓存 {usage['disk_bytes'] / 1024 / 1024:.1f} MB"
+            )
+        st.caption(
+            f"当前进程共 {store.session_count()} 个活跃会话，空闲 "
+            f"{store.idle_ttl / 60:.0f} 分钟后清除"
+        )
@@ -0,0 +1,89 @@
+import importlib
+import os
+import threading
+import time
+
+from utils import metrics
+
+# 设为 0 时不在第一次运行时预热缓存
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") != "0"
+# 预热时提前导入的较慢的模块，登录页用不到它们
+WARMUP_IMPORTS = ("PIL.Image", "PIL.ImageOps", "streamlit_image_select")
+
+_started = set()
+_recorded = set()
+_timings = {}
+_lock = threading.Lock()
+
+
+def _once(key) -> bool:
+    with _lock:
+        if key in _recorded:
+            return False
+        _recorded.add(key)
+        return True
+
+
+def _record(app: str, name: str, seconds: float) -> None:
+    with _lock:
+        _timings.setdefault(app, {})[name] = seconds
+    metrics.observe(f"startup_{name}", seconds, app=app)
+    print(f"{app} startup {name}: {seconds:.3f}s")
+
+
+def imported(app: str, seconds: float) -> None:
+    """Record how long the first run of ``app`` spent on its imports."""
+    if _once((app, "imports")):
+        _record(app, "imports", seconds)
+
+
+def rendered(app: str, page: str, seconds: float) -> None:
+    """Record the duration of the first run of ``page`` ("login" or "main") in this process."""
+    if _once((app, page)):
+        _record(app, f"first_render_{page}", seconds)
+
+
+def timings() -> dict:
+    """Recorded startup timings per app, in seconds."""
+    with _lock:
+        return {app: dict(values) for app, values in _timings.items()}
+
+
+def warm_up(app: str, *tasks) -> None:
+    """
+    Run ``tasks`` once per process on a background thread.
+
+    Called on the first script run, usually the login page, so the slow
+    imports and the catalog, gallery and token caches are ready by the time
+    the first user has logged in. Tasks must not call Streamlit APIs; a
+    failing task is logged and the remaining ones still run.
+
+    Args:
+        app (str): Name of the app, used to run its warm-up only once.
+        *tasks (callable): Zero-argument functions filling caches.
+    """
+    if not STARTUP_WARMUP:
+        return
+    with _lock:
+        if app in _started:
+            return
+        _started.add(app)
+
+    def run():
+        started = time.perf_counter()
+        for name in WARMUP_IMPORTS:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print(f"Warm-up import of {name} failed: {e}")
+        for task in tasks:
+            name = getattr(task, "__name__", "task")
+            try:
+                with metrics.span("warmup", app=app, task=name):
+                    task()
+            except Exception as e:
+                # 预热失败不影响正常请求，页面用到时会重新加载
+                print(f"Warm-up task {name} of {app} failed: {e}")
+        _record(app, "warmup", time.perf_counter() - started)
+
+    threading.Thread(target=run, name=f"{app}-warmup", daemon=True).start()
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from utils.downloads import fetch_image
+from utils.image_cache import IMAGE_CACHE_DIR
+
+# 缩略图最长边（像素）、格式(WEBP/JPEG)和压缩质量
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "WEBP").upper()
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+# 后台生成缩略图的线程数，以及渲染画廊时最多等待缩略图的时间（秒）
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_WAIT = float(os.getenv("THUMBNAIL_WAIT", "2"))
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", os.path.join(IMAGE_CACHE_DIR, "thumbnails"))
+
+_pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+_pending = {}
+_lock = threading.Lock()
+
+
+def thumbnail_path(url: str) -> str:
+    key = f"{url}|{THUMBNAIL_SIZE}|{THUMBNAIL_FORMAT}|{THUMBNAIL_QUALITY}"
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    extension = "jpg" if THUMBNAIL_FORMAT == "JPEG" else THUMBNAIL_FORMAT.lower()
+    return os.path.join(THUMBNAIL_DIR, f"{digest}.{extension}")
+
+
+def _build(url: str) -> str:
+    path = thumbnail_path(url)
+    if os.path.exists(path):
+        return path
+    # PIL 导入较慢，只在真正需要生成缩略图时导入
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(fetch_image(url))))
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    if THUMBNAIL_FORMAT == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    image.save(tmp_path, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _schedule(url: str):
+    with _lock:
+        future = _pending.get(url)
+        if future is not None:
+            return future
+        future = _pool.submit(_build, url)
+        _pending[url] = future
+    # 释放锁之后再注册回调：任务已经结束时回调会立即在当前线程执行，而它也要取这把锁
+    future.add_done_callback(lambda done: _forget(url, done))
+    return future
+
+
+def _forget(url: str, future) -> None:
+    with _lock:
+        if _pending.get(url) is future:
+            del _pending[url]
+
+
+def thumbnails(urls: list, wait_for: float = THUMBNAIL_WAIT) -> list:
+    """
+    Return local thumbnail paths for ``urls``, building missing ones in the background.
+
+    Args:
+        urls (list): Full-resolution image URLs.
+        wait_for (float): Seconds to wait for thumbnails that are not built
+            yet. Anything still missing afterwards is returned as None and
+            will be ready on a later rerun.
+
+    Returns:
+        list: A thumbnail path or None for each URL, in the same order.
+    """
+    paths = [thumbnail_path(url) for url in urls]
+    futures = [
+        _schedule(url) for url, path in zip(urls, paths) if not os.path.exists(path)
+    ]
+    if futures:
+        wait(futures, timeout=wait_for)
+    return [path if os.path.exists(path) else None for path in paths]
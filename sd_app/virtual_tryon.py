@@ -1,13 +1,22 @@
 import time
+
+# 每次运行的开始时间，用于统计冷启动时的导入和首次渲染耗时
+_run_started = time.perf_counter()
+
 import streamlit as st
 import requests
+from functools import partial
+from utils import (
+    admission, auth, batch, icon, concurrent_io, executor, gallery, jobs, journal, kling_api,
+    lazy_download, metrics, session_store, startup,
+)
+from utils.downloads import fetch_image
+from utils.memo import content_hash, memo, request_key
+from utils.preprocess import PreparedInputs
+from utils.thumbnails import thumbnails
 import zipfile
-import io
-from utils import icon
-from streamlit_image_select import image_select
-import jwt
-import os
-import base64
+
+startup.imported("virtual_tryon", time.perf_counter() - _run_started)
 
 # UI configurations
 st.set_page_config(
@@ -15,91 +24,33 @@ st.set_page_config(
 )
 icon.show_icon("🎩")
 st.markdown("# :rainbow[AI一键换装]")
-
-KELING_API_URL = "https://api.klingai.com"
-AK = os.getenv("KELING_AK", "")
-SK = os.getenv("KELING_SK", "")
-# 用户名和密码的默认值
-DEFAULT_USERNAME = "admin"
-DEFAULT_PASSWORD = "123456"
+metrics.serve()
+
+# session_state / URL 参数中保存当前任务的键
+JOB_KEY = "tryon_job"
+BATCH_KEY = "tryon_batch"
+# 多页面应用中各页面共用 session_state，画廊条数按页面区分
+GALLERY_LIMIT_KEY = "kling_gallery_limit"
+
+# 批量试穿网格中每个格子的状态说明
+CELL_STATES = {
+    jobs.PENDING: "⏳ 排队中",
+    jobs.RUNNING: "🔄 试穿中",
+    jobs.SUCCEEDED: "✅ 完成",
+    jobs.FAILED: "❌ 失败",
+    jobs.CANCELLED: "⏹ 已取消",
+    jobs.TIMED_OUT: "⌛ 超时",
+}
 
 # Placeholders for images and gallery
 generated_images_placeholder = st.empty()
+batch_placeholder = st.empty()
 gallery_placeholder = st.empty()
 
 
-# 将图片编码为 Base64 格式
-def get_base64_of_bin_file(data):
-    return base64.b64encode(data).decode()
-
-
-def encode_jwt_token(ak, sk):
-    headers = {
-        "alg": "HS256",
-        "typ": "JWT"
-    }
-    payload = {
-        "iss": ak,
-        "exp": int(time.time()) + 1800,  # 有效时间，此处示例代表当前时间+1800s(30min)
-        "nbf": int(time.time()) - 5  # 开始生效的时间，此处示例代表当前时间-5秒
-    }
-    token = jwt.encode(payload, sk, headers=headers)
-    return token
-
 def on_click(url):
     st.write(f"Selected image: {url}")
 
-def login_page():
-    with st.form("login_form"):
-        st.title("登录")
-        username = st.text_input("用户名", value="")
-        password = st.text_input("密码", value="", type="password")
-        submit = st.form_submit_button("登录")
-
-        if submit:
-            if username == DEFAULT_USERNAME and password == DEFAULT_PASSWORD:
-                st.success("登录成功！")
-                # 更新会话状态为已登录
-                st.session_state.logged_in = True
-                st.rerun()  # 重新运行脚本以显示主页面
-            else:
-                st.error("用户名或密码错误，请重新输入。")
-
-
-def fetch_checkpoints(api_url: str) -> list:
-    """
-    Fetch checkpoints from the backend API.
-
-    Args:
-        api_url (str): The URL of the backend API to fetch checkpoints from.
-
-    Returns:
-        list: A list of checkpoints.
-    """
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-        # return data.get("checkpoints", [])
-        return {
-            item["name"]: item["model_version_uuid"]
-            for item in data.get("data", []).get("item", [])
-        }
-    except requests.RequestException as e:
-        st.error(f"Failed to fetch checkpoints: {e}")
-        return []
-
-
-def fetch_sampler(api_url: str) -> list:
-    try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("data", []).get("item", [])
-    except requests.RequestException as e:
-        st.error(f"Failed to fetch sampler: {e}")
-        return []
-
 
 def configure_sidebar() -> None:
     """
@@ -111,18 +62,59 @@ def configure_sidebar() -> None:
 
     checkpoints = ["kolors-virtual-try-on-v1"]
     with st.sidebar:
+        # 表单内的控件修改不会触发重跑，所以模式切换放在表单外
+        batch_mode = st.radio("试穿模式", ["单张", "批量"], horizontal=True) == "批量"
         with st.form("my_form"):
             st.info("**虚拟试穿 ↓**", icon="👔")
             # checkpoint_name = st.selectbox("基础模型", checkpoints)
             checkPointId = "kolors-virtual-try-on-v1"
             # Advanced Settings (for the curious minds!)
-            image_human = st.file_uploader("上传人物图片")
-            image_clothes = st.file_uploader("上传衣服图片")
+            # 提交后换一组 key，让 Streamlit 释放已上传文件占用的内存
+            generation = st.session_state.setdefault("upload_generation", 0)
+            batch_options = None
+            if batch_mode:
+                # 每张人物图和每件衣服两两组合，共 M×N 个试穿任务
+                image_types = [ext.lstrip(".") for ext in batch.IMAGE_EXTENSIONS] + ["zip"]
+                image_human = image_clothes = None
+                batch_options = {
+                    "humans": st.file_uploader(
+                        "上传人物图片（可多选或 ZIP）",
+                        type=image_types,
+                        accept_multiple_files=True,
+                        key=f"batch_human_{generation}",
+                    ),
+                    "clothes": st.file_uploader(
+                        "上传衣服图片（可多选或 ZIP）",
+                        type=image_types,
+                        accept_multiple_files=True,
+                        key=f"batch_clothes_{generation}",
+                    ),
+                    "max_in_flight": st.slider(
+                        "同时运行的任务数",
+                        value=min(
+                            batch.BATCH_MAX_IN_FLIGHT, executor.BACKEND_CONCURRENCY["kling"]
+                        ),
+                        min_value=1,
+                        max_value=executor.BACKEND_CONCURRENCY["kling"],
+                    ),
+                }
+            else:
+                image_human = st.file_uploader("上传人物图片", key=f"image_human_{generation}")
+                image_clothes = st.file_uploader(
+                    "上传衣服图片", key=f"image_clothes_{generation}"
+                )
             # The Big Red "Submit" Button!
             submitted = st.form_submit_button(
                 "Submit", type="primary", use_container_width=True
             )
 
+        # 按登录用户列出任务日志中的任务，服务重启后也能重新查看运行中或已完成的任务
+        chosen = journal.show_my_jobs("kling", lambda params: params.get("model_name", ""))
+        if chosen is not None and executor.reattach(JOB_KEY, chosen) is None:
+            st.warning("该任务不在当前服务进程中，暂时无法查看。")
+
+        session_store.show_memory_report()
+
         # Credits and resources
         st.divider()
         
@@ -131,156 +123,360 @@ def configure_sidebar() -> None:
             checkPointId,
             image_human,
             image_clothes,
+            batch_options,
         )
 
 
+@st.fragment(run_every=jobs.POLL_TICK)
+def task_progress() -> None:
+    """Show the progress of the background task without rerunning the whole page."""
+    job = executor.get(st.session_state.get(JOB_KEY))
+    if job is None or job.done:
+        # 任务结束后整页重跑一次，由 main_page 展示结果并停止刷新
+        st.rerun()
+
+    with st.status("👩🏾‍🍳 Whipping up your words into art...", expanded=True):
+        st.write("⚙️ Model initiated")
+        st.write("🙆‍♀️ Stand up and strecth in the meantime")
+        # 输入图片只以句柄保存，按需从磁盘缓存读取
+        inputs = [session_store.store.load(handle) for handle in job.info.get("inputs", [])]
+        if len(inputs) == 2 and all(data is not None for data in inputs):
+            st.write("本次任务的输入为：")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.image(inputs[0], caption="人物图片 🧍‍♂️", width=300)
+            with col2:
+                st.image(inputs[1], caption="衣服图片 👗", width=300)
+        for name, stats in job.info.get("preprocess", []):
+            st.write(
+                f"📉 {name}: {stats['original_bytes'] / 1024:.0f} KB "
+                f"{stats['original_size'][0]}x{stats['original_size'][1]} → "
+                f"{stats['bytes'] / 1024:.0f} KB {stats['size'][0]}x{stats['size'][1]}"
+            )
+        if job.remote_id:
+            st.write("🔥 请稍等片刻，正在生成中...")
+            st.write(f"当前正在试穿的任务id: {job.remote_id}")
+        else:
+            ahead = executor.queue_position(job)
+            st.write(f"⏳ 排队中，前面还有 {ahead} 个任务..." if ahead else "⏳ 排队中...")
+        st.write(f"⏱️ 已等待 {job.elapsed:.0f} 秒")
+
+
+def show_task_result(job) -> None:
+    """Render the outcome of a finished task: images with downloads, or the failure."""
+    if job.state != jobs.SUCCEEDED:
+        reason = {
+            jobs.FAILED: "任务失败，请重试。",
+            jobs.CANCELLED: "任务已取消。",
+            jobs.TIMED_OUT: "任务超时，请稍后重试。",
+        }[job.state]
+        st.error(f"{reason} {job.message}", icon="🚨")
+        return
+
+    st.session_state.task_id = job.remote_id
+    with st.status("✅ Images generated!", state="complete", expanded=False):
+        st.write(f"任务id: {job.remote_id}")
+        if job.info.get("memo") == "hit":
+            st.write("♻️ 与之前的请求完全相同，直接复用了已有结果")
+        if job.info.get("journal") == "replay":
+            st.write("📋 从任务日志中恢复的结果")
+    if job.results:
+        st.toast("Your image has been generated!", icon="😍")
+        show_result(session_store.add_result("kling", job))
+
+
+def show_result(record: dict) -> None:
+    """Render a stored result; images are read from the disk cache by handle."""
+    # Displaying the image
+    with st.expander("🎉 换装成功 🎉", expanded=True):
+        for i, image, error in record["images"]:
+            with st.container():
+                if error is None:
+                    try:
+                        image_data = session_store.store.load(image)
+                    except requests.RequestException as e:
+                        error = e
+                if error is not None:
+                    st.error(
+                        f"Failed to fetch image from {image}. Error: {error}",
+                        icon="🚨",
+                    )
+                    continue
+                st.image(
+                    image_data,
+                    caption="🎈Generated Image 🎈",
+                    # use_column_width=True,
+                    width=300
+                )
+                # Create a download button for each image, filled only when requested
+                lazy_download.download_button(
+                    f":red[**Download Image {i+1}**]",
+                    key=f"kling_{record['job_id']}_{i}",
+                    build=partial(session_store.store.load, image),
+                    file_name=f"作品_{i+1}.png",
+                    mime="image/png",
+                )
+
+
+def start_batch(checkPointId: str, batch_options: dict) -> None:
+    """Pair every uploaded person with every garment and start the try-on batch."""
+    try:
+        humans = batch.read_images(batch_options["humans"])
+        clothes = batch.read_images(batch_options["clothes"])
+    except zipfile.BadZipFile as e:
+        st.error(f"无法读取压缩包: {e}", icon="🚨")
+        return
+    if not humans or not clothes:
+        st.error("请至少上传一张人物图片和一张衣服图片。", icon="🚨")
+        return
+    if len(humans) * len(clothes) > batch.BATCH_MAX_JOBS:
+        st.error(
+            f"共 {len(humans)}×{len(clothes)} 个组合，超过单次上限 {batch.BATCH_MAX_JOBS}，"
+            "请减少图片数量。",
+            icon="🚨",
+        )
+        return
+    # 整个批量算一次提交；批量内部由 max_in_flight 控制对后端的并发
+    allowed, reason = admission.admit("kling")
+    if not allowed:
+        st.warning(reason, icon="⏳")
+        return
+
+    # 上传的图片按内容存入磁盘缓存，任务里只保存句柄
+    human_handles = [session_store.put_blob(data) for _, data in humans]
+    cloth_handles = [session_store.put_blob(data) for _, data in clothes]
+    payloads = [
+        {
+            "model_name": checkPointId,
+            "row": row,
+            "col": col,
+            "human": human_name,
+            "cloth": cloth_name,
+            "human_image": human_handle,
+            "cloth_image": cloth_handle,
+            "file_stem": f"r{row + 1:02d}_c{col + 1:02d}",
+        }
+        for row, ((human_name, _), human_handle) in enumerate(zip(humans, human_handles))
+        for col, ((cloth_name, _), cloth_handle) in enumerate(zip(clothes, cloth_handles))
+    ]
+    uses = {}
+    for payload in payloads:
+        for handle in (payload["human_image"], payload["cloth_image"]):
+            uses[handle] = uses.get(handle, 0) + 1
+    inputs = PreparedInputs(session_store.store.load, uses)
+
+    previous = st.session_state.get(BATCH_KEY)
+    if previous:
+        batch.discard(previous)
+    current = batch.start(
+        "kling",
+        payloads,
+        lambda job, payload: kling_api.run_tryon_pair(job, payload, inputs),
+        batch_options["max_in_flight"],
+        # 取消或失败的单元格不会取走自己的输入，批量结束时统一释放
+        on_finish=inputs.clear,
+    )
+    st.session_state[BATCH_KEY] = current.id
+    st.query_params[BATCH_KEY] = current.id
+    st.session_state.upload_generation += 1
+
+
+def show_batch_grid(current) -> None:
+    """Show batch progress and the person × garment grid with each cell's status."""
+    counts = current.counts()
+    finished = sum(counts.get(state, 0) for state in jobs.TERMINAL_STATES)
+    st.progress(
+        finished / len(current.items),
+        text=f"已完成 {finished}/{len(current.items)}，"
+        f"运行中 {counts.get(jobs.RUNNING, 0)}，失败 {counts.get(jobs.FAILED, 0) + counts.get(jobs.TIMED_OUT, 0)}",
+    )
+    humans = {item.payload["row"]: item.payload["human"] for item in current.items}
+    clothes = {item.payload["col"]: item.payload["cloth"] for item in current.items}
+    cells = {(item.payload["row"], item.payload["col"]): item for item in current.items}
+
+    header = st.columns(len(clothes) + 1)
+    for col, name in clothes.items():
+        header[col + 1].caption(f"👗 {name}")
+    for row, name in humans.items():
+        cols = st.columns(len(clothes) + 1)
+        cols[0].caption(f"🧍 {name}")
+        for col in clothes:
+            item = cells[(row, col)]
+            with cols[col + 1]:
+                if item.state == jobs.SUCCEEDED and item.images:
+                    st.image(item.images[0], use_column_width=True)
+                else:
+                    st.caption(CELL_STATES[item.state])
+                    if item.state in (jobs.FAILED, jobs.TIMED_OUT) and item.job is not None:
+                        st.caption(item.job.message)
+
+
+@st.fragment(run_every=jobs.POLL_TICK)
+def batch_progress() -> None:
+    """Fill in the grid as cells finish without rerunning the whole page."""
+    current = batch.get(st.session_state.get(BATCH_KEY))
+    if current is None or current.done:
+        st.rerun()
+    st.info(f"🧪 批量试穿中，共 {len(current.items)} 个组合", icon="⏳")
+    show_batch_grid(current)
+    if st.button("⏹ 停止批量任务"):
+        current.cancel()
+
+
+def show_batch(current) -> None:
+    """Show a finished batch with its archive and manifest download."""
+    st.success(f"✅ 批量试穿结束，共 {len(current.manifest)} 张图片", icon="🎉")
+    show_batch_grid(current)
+    col1, col2 = st.columns(2)
+    with col1:
+        # 压缩包已经在磁盘上，点击后才读取
+        lazy_download.download_button(
+            ":red[**Download the Images + manifest.json**]",
+            key=f"batch_{current.id}",
+            build=lambda: open(current.zip_path, "rb"),
+            file_name="tryon_batch.zip",
+            mime="application/zip",
+            use_container_width=True,
+        )
+    with col2:
+        if st.button("🧹 清除批量结果", use_container_width=True):
+            batch.discard(current.id)
+            st.session_state.pop(BATCH_KEY, None)
+            if BATCH_KEY in st.query_params:
+                del st.query_params[BATCH_KEY]
+            st.rerun()
+
+
+def start_gallery_listing():
+    """Start loading the gallery entries for this rerun on the shared I/O pool."""
+    limit = st.session_state.setdefault(GALLERY_LIMIT_KEY, gallery.GALLERY_PAGE_SIZE)
+    return concurrent_io.spawn(
+        gallery.service("kling", kling_api.fetch_gallery_page).entries, limit
+    )
+
 
 def main_page(
     submitted: bool,
     checkPointId: str,
     image_human: str,
     image_clothes: str,
+    batch_options: dict = None,
+    gallery_entries=None,
 ) -> None:
-    if submitted:
-        with st.status(
-            "👩🏾‍🍳 Whipping up your words into art...", expanded=True
-        ) as status:
-            st.write("⚙️ Model initiated")
-            st.write("🙆‍♀️ Stand up and strecth in the meantime")
-            try:
-                with generated_images_placeholder.container():
-                    # 调用后端接口以获取任务的 UUID
-                    st.write("本次任务的输入为：")
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.image(image_human, caption="人物图片 🧍‍♂️", width=300)
-                    with col2:
-                        st.image(image_clothes, caption="衣服图片 👗", width=300)
-                    st.write("🚀 开始虚拟试穿...")
-                    st.write("🔥 请稍等片刻，正在生成中...")
-
-                    token = encode_jwt_token(AK, SK)
-                    # st.write(image_human)
-                    # 支持传入图片Base64编码或图片URL
-                    
-                    human_image_base64 = get_base64_of_bin_file(image_human.getvalue())
-                    clothes_image_base64 = get_base64_of_bin_file(image_clothes.getvalue())
-                    # st.write(human_image_base64)
-                    response = requests.post(
-                        KELING_API_URL + "/v1/images/kolors-virtual-try-on",
-                        headers={"Authorization": f"Bearer {token}"},
-                        json={
-                            "model_name": checkPointId,
-                            "human_image": human_image_base64,
-                            "cloth_image": clothes_image_base64,
-                        },
-                    )
-                    response.raise_for_status()
-                    task_id = response.json().get("data").get("task_id")
-                    st.session_state.task_id = task_id
-                    st.write(f"当前正在试穿的任务id: {task_id}")
-
-                    # 轮询后端接口以获取生成的图片
-                    all_images = []
-                    while True:
-                        result_response = requests.get(
-                            f"{KELING_API_URL}/v1/images/kolors-virtual-try-on/{task_id}",
-                            headers={"Authorization": f"Bearer {token}"},
-                        )
-                        result_response.raise_for_status()
-                        result_data = result_response.json()
-                        if result_data.get("data").get("task_status") == "succeed":
-                            task_result = result_data.get("data", {}).get("task_result", {})
-                            for image in task_result.get("images", []):
-                                all_images.append(image.get("url"))
-
-                            break
-                        
-                        time.sleep(2)  # 等待 5 秒后再次轮询
-                    
-                    result_images = []
-                    if all_images:
-                        st.toast("Your image has been generated!", icon="😍")
-                        st.session_state.generated_image = all_images
-
-                        # Displaying the image
-                        with st.expander("🎉 换装成功 🎉", expanded=True):
-                            for i, image in enumerate(st.session_state.generated_image):
-                                with st.container():
-                                    st.image(
-                                        image,
-                                        caption="🎈Generated Image 🎈",
-                                        # use_column_width=True,
-                                        width=300
-                                    )
-                                    response = requests.get(image)
-                                    if response.status_code == 200:
-                                        image_data = response.content
-                                        result_images.append(image_data)
-                                        # Create a download button for each image
-                                        st.download_button(
-                                            f":red[**Download Image {i+1}**]",
-                                            data=image_data,
-                                            file_name=f"作品_{i+1}.png",
-                                            mime="image/png",
-                                        )
-                                    else:
-                                        st.error(
-                                            f"Failed to fetch image from {image}. Error code: {response.status_code}",
-                                            icon="🚨",
-                                        )
-                    
-                status.update(
-                    label="✅ Images generated!", state="complete", expanded=False
-                )
-            except Exception as e:
-                print(e)
-                st.error(f"Encountered an error: {e}", icon="🚨")
+    allowed = False
+    if submitted and batch_options is not None:
+        start_batch(checkPointId, batch_options)
+    elif submitted and (image_human is None or image_clothes is None):
+        # 先检查输入，缺少图片时不消耗提交额度
+        st.error("请先上传人物图片和衣服图片。", icon="🚨")
+    elif submitted:
+        # 超过提交频率或后端队列已满时直接提示，不进入队列
+        allowed, reason = admission.admit("kling")
+        if not allowed:
+            st.warning(reason, icon="⏳")
+    if allowed:
+        # 只把任务放入后台队列，提交、轮询和下载都在后台线程完成；
+        # 同一模型下两张图片内容完全相同的请求直接复用已有结果
+        human_image = image_human.getvalue()
+        cloth_image = image_clothes.getvalue()
+        key = request_key(
+            "kling",
+            {
+                "model_name": checkPointId,
+                "human_image": content_hash(human_image),
+                "cloth_image": content_hash(cloth_image),
+            },
+        )
+        job = memo.run(key, "kling", kling_api.run_tryon, checkPointId, human_image, cloth_image)
+        job.info.setdefault(
+            "inputs", [session_store.put_blob(human_image), session_store.put_blob(cloth_image)]
+        )
+        executor.track(JOB_KEY, job)
+        # 任务日志只记录模型和输入图片的句柄，不保存图片本身
+        journal.add(job, {"model_name": checkPointId, "inputs": job.info["inputs"]})
+        st.session_state.upload_generation += 1
+
+    # 批量任务一直保留到用户清除，方便查看结果和下载
+    current_batch = batch.get(
+        st.session_state.get(BATCH_KEY) or st.query_params.get(BATCH_KEY)
+    )
+    if current_batch is not None:
+        st.session_state[BATCH_KEY] = current_batch.id
+        with batch_placeholder.container():
+            if current_batch.done:
+                show_batch(current_batch)
+            else:
+                batch_progress()
+
+    # 有进行中的任务（包括刷新页面后从 URL 恢复的任务）时继续展示进度，不会重新提交
+    job = executor.resume(JOB_KEY)
+    if job is not None:
+        with generated_images_placeholder.container():
+            if job.done:
+                executor.forget(JOB_KEY)
+                show_task_result(job)
+            else:
+                task_progress()
 
     # If not submitted, chill here 🍹
     else:
-        pass
+        # 没有进行中的任务时继续展示本会话最近一次的结果
+        latest = session_store.results("kling")[:1]
+        if latest:
+            with generated_images_placeholder.container():
+                show_result(latest[0])
 
     # Gallery display for inspo
     with gallery_placeholder.container():
         st.write("🎨 **往期生成记录**")
-        token = encode_jwt_token(AK, SK)
-        response = requests.get(
-            f"{KELING_API_URL}/v1/images/kolors-virtual-try-on",
-            headers={"Authorization": f"Bearer {token}"},
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        images = []
-        for task in data.get("data", []):
-            task_result = task.get("task_result", {})
-            for image in task_result.get("images", []):
-                images.append(image.get("url"))
-
-        images = images[:10]
-    
-        selected_image = image_select("请选择一张图片,下方预览下载～😉:", images)
-        
+        tryon_gallery = gallery.service("kling", kling_api.fetch_gallery_page)
+        if gallery_entries is None:
+            gallery_entries = start_gallery_listing()
+        try:
+            entries = gallery_entries.result()
+        except requests.RequestException as e:
+            st.error(f"Failed to fetch gallery: {e}", icon="🚨")
+            entries = []
+
+        images = [image for entry in entries for image in entry["images"]]
+        # 画廊只展示缩略图，选中后才读取原图用于预览和下载
+        ready = [
+            (image, thumb)
+            for image, thumb in zip(images, thumbnails(images))
+            if thumb is not None
+        ]
+        selected_image = None
+        if not ready:
+            st.info("🖼️ 缩略图生成中，请稍后刷新～")
+        else:
+            # 组件导入较慢，登录页用不到，到这里才导入（启动预热时已在后台导入）
+            from streamlit_image_select import image_select
+
+            selected = image_select(
+                "请选择一张图片,下方预览下载～😉:",
+                [thumb for _, thumb in ready],
+                return_value="index",
+            )
+            selected_image = ready[selected][0]
+
         if selected_image:
             with st.expander("Image Preview", expanded=True):
+                # 预览由浏览器直接从图片地址加载；原图只在点击下载时读取，
+                # 且从本地图片缓存读取，同一张图只会从源站下载一次
                 st.image(selected_image, width=300)
-                response = requests.get(selected_image)
-                if response.status_code == 200:
-                    image_data = response.content
-                    st.download_button(
-                        "Download Image",
-                        data=image_data,
-                        file_name="作品.png",
-                        mime="image/png",
-                    )
-                else:
-                    st.error(
-                        f"Failed to fetch image from {selected_image}. Error code: {response.status_code}",
-                        icon="🚨",
-                    )
+                lazy_download.download_button(
+                    "Download Image",
+                    key=f"kling_gallery_{selected_image}",
+                    build=partial(fetch_image, selected_image),
+                    file_name="作品.png",
+                    mime="image/png",
+                )
+        if tryon_gallery.has_more and st.button("⬇️ 加载更多记录"):
+            st.session_state[GALLERY_LIMIT_KEY] += gallery.GALLERY_PAGE_SIZE
+            st.rerun()
 
 
+@metrics.span("rerun", app="virtual_tryon")
 def main():
     """
     Main function to run the Streamlit application.
@@ -289,27 +485,34 @@ def main():
     It retrieves the user inputs from the sidebar, and passes them to the main page function.
     The main page function then generates images based on these inputs.
     """
+    session_store.touch()
+    # 图库列表与侧边栏、任务进度互不依赖，先在后台开始拉取
+    gallery_entries = start_gallery_listing()
     (
         submitted,
         checkPointId,
         image_human,
         image_clothes,
+        batch_options,
     ) = configure_sidebar()
     main_page(
         submitted,
         checkPointId,
         image_human,
         image_clothes,
+        batch_options,
+        gallery_entries,
     )
 
 
-# 检查会话状态中是否有登录状态，如果没有，初始化为 False
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-
-if __name__ == "__main__":
+# 单独运行时模块名是 __main__，作为 app.py 中的页面运行时是 __page__
+if __name__ in ("__main__", "__page__"):
+    # 进程内第一次运行（通常是登录页）时在后台预热，用户登录后不必再等网络
+    startup.warm_up("virtual_tryon", kling_api.warm_token, kling_api.warm_gallery)
     # main()
-    if st.session_state.logged_in:
+    if auth.logged_in():
         main()
+        startup.rendered("virtual_tryon", "main", time.perf_counter() - _run_started)
     else:
-        login_page()
\ No newline at end of file
+        auth.login_page()
+        startup.rendered("virtual_tryon", "login", time.perf_counter() - _run_started)